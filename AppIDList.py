@@ -11,36 +11,71 @@
 # Compare review score for all reviews and steam purchases only as histogram is steam purchases only
 
 from argparse import ArgumentParser
+import datetime as dt
 import json
+import os
 import sys
-import requests
+from fetcher import API_URL, Fetcher
 
-# Get the request and return it.
-def make_request(params):
-    req = requests.get("https://api.steampowered.com/IStoreService/GetAppList/v1/",
-                       params=params, timeout=5)
-    req.encoding = "utf-8"
+# Get the request and return the decoded JSON, retrying if it fails.
+def make_request(fetcher, params, api_url = API_URL):
+    data = fetcher.get_json(f"{api_url}/IStoreService/GetAppList/v1/", params=params)
+    if data is None:
+        print("ERROR: Couldn't get the app list from the steam API.")
+        sys.exit(1)
 
-    return req
-
-# Make files for each JSON request we get back, each file should have 10k results in it.
-def store_data(params, filename):
-    counter = 0
+    return data
 
+# Yields the text of each page of results, following last_appid until there are no more.
+def iter_pages(params, api_url = API_URL):
+    params = dict(params)
     finished = False
+    # The pages are big so allow longer than the scrapers do, and there's only ever one request at once
+    fetcher = Fetcher(workers=1, rate=0, timeout=30)
 
     while not finished:
-        req = make_request(params)
-        with open(f"{filename}{str(counter)}.json", "+w", encoding="utf-8") as f:
-            f.write(req.text)
-        counter += 1
-        data = json.loads(req.text)
+        data = make_request(fetcher, params, api_url)
+        yield json.dumps(data)
         # have_more_results is true if there are and non-existant if there aren't
         if "have_more_results" in data["response"].keys():
             last_id = data["response"]["last_appid"]
             params["last_appid"] = last_id
         else:
             finished = True
+    fetcher.close()
+
+# Make files for each JSON request we get back, each file should have 10k results in it.
+def store_data(params, filename, api_url = API_URL):
+    counter = 0
+
+    for text in iter_pages(params, api_url):
+        with open(f"{filename}{str(counter)}.json", "+w", encoding="utf-8") as f:
+            f.write(text)
+        counter += 1
+    # Remove any files left over from a previous run which had more pages
+    while os.path.exists(f"{filename}{str(counter)}.json"):
+        os.remove(f"{filename}{str(counter)}.json")
+        counter += 1
+
+
+# Makes the GetAppList parameters for either the games or the DLC, only asking for apps
+# changed since the given timestamp if there is one.
+def app_params(apikey, dlc = False, since = None):
+    params = {"key": apikey}
+    if dlc:
+        params.update({"include_games": False, "include_dlc": True})
+    if since:
+        params["if_modified_since"] = since
+    return params
+
+# Turns the --since argument, either a unix timestamp or an ISO date, into a timestamp.
+def parse_since(since):
+    if since.isdigit():
+        return int(since)
+    date = dt.datetime.fromisoformat(since)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=dt.UTC)
+    return int(date.timestamp())
 
 
 def __main__():
@@ -55,6 +90,22 @@ def __main__():
         default="",
         help="REQUIRED: Your steam API key"
     )
+    parser.add_argument(
+        "-s",
+        "--since",
+        action="store",
+        dest="since",
+        default="",
+        help="Only get apps changed since this unix timestamp or ISO date. The results go in "
+             "gamedelta and DLCdelta files, which csvmaker.py --merge adds to data.csv"
+    )
+    parser.add_argument(
+        "--api-url",
+        action="store",
+        dest="api_url",
+        default=API_URL,
+        help="Base URL of the steam API, change this to use a local server like mockserver.py"
+    )
 
     args = parser.parse_args()
     apikey = args.key
@@ -63,5 +114,14 @@ def __main__():
         print("ERROR: API credentials must be supplied.")
         sys.exit()
 
-    store_data({"key": apikey}, "gamedata")
-    store_data({"key": apikey, "include_games": False, "include_dlc": True}, "DLCdata")
+    if args.since:
+        since = parse_since(args.since)
+        store_data(app_params(apikey, since=since), "gamedelta", args.api_url)
+        store_data(app_params(apikey, dlc=True, since=since), "DLCdelta", args.api_url)
+    else:
+        store_data(app_params(apikey), "gamedata", args.api_url)
+        store_data(app_params(apikey, dlc=True), "DLCdata", args.api_url)
+
+
+if __name__ == "__main__":
+    __main__()
@@ -1,12 +1,25 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 import datetime as dt
+from functools import partial
+import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as tkr
-from utils import MonthlyRecommends, MONTHS
+import cache
+from cache import cached, file_fingerprint
+from metrics import profiled
+from monthgrid import MonthGrid, scores
+import stats
+from utils import LazySeries, MonthlyRecommends, MonthSeries, MONTH_ARRAY, MONTHS, SeriesIndex, worker_context
 
 TZ = dt.UTC
 MAX_R = 9000000 # CS2 at about 8.8 million
+# The ways of scoring each game which review_ratios can use, with how they are labelled.
+SCORES = {
+    "raw": "% reviews positive",
+    "wilson": "Wilson lower bound of % reviews positive",
+    "steamdb": "SteamDB rating",
+}
 
 # Turn the strings in the dataframe into my custom Object.
 def fix_data(string):
@@ -18,51 +31,174 @@ def fix_data(string):
         result.append(MonthlyRecommends(date, int(up), int(down)))
     return result
 
-# Helper function to import the data with the time series
-def import_data():
+# Memory maps the time series written by data-normaliser.py. Returns the data without the
+# time series, a (games, months, 2) array of the up and down counts for each game in the
+# same order as the rows, and the timestamps of the months.
+def import_matrix():
     import_df = pd.read_csv("normalised_data.csv")
-    import_df["time_series"] = import_df["time_series"].apply(fix_data)
+    series = np.load("normalised_series.npy", mmap_mode="r")
+    months = np.load("normalised_months.npy")
+    if len(series) != len(import_df.index):
+        raise ValueError("normalised_series.npy doesn't match normalised_data.csv, rerun data-normaliser.py")
+    return import_df, series, months
+
+# Keeps the games with min_reviews to max_reviews-1 reviews of the type, the same as the
+# database's read_apps and read_time_data do in SQL. None doesn't filter on it.
+def filter_apps(df: pd.DataFrame, min_reviews = None, max_reviews = None, type_ = None):
+    mask = np.ones(len(df.index), dtype=bool)
+    if min_reviews is not None:
+        mask &= df["total_reviews"].to_numpy() >= min_reviews
+    if max_reviews is not None:
+        mask &= df["total_reviews"].to_numpy() < max_reviews
+    if type_ is not None:
+        mask &= (df["type"] == type_).to_numpy()
+    return df.loc[mask]
+
+# Reads the plain data from normalised_data.csv or the SQLite database if db is given, and
+# finds where each game's time series is stored. The database only reads the games with
+# min_reviews to max_reviews-1 reviews of the type, using its indexes. Returns the data and a
+# SeriesIndex whose positions are the df's index.
+def import_index(db = "", min_reviews = None, max_reviews = None, type_ = None):
+    if db:
+        from store import Store
+        with Store(db) as store:
+            import_df = store.read_time_data(min_reviews, max_reviews, type_)
+        appids = import_df["appid"].to_numpy()
+        def load(positions):
+            with Store(db) as store:
+                return store.read_series(appids[positions])
+        import_df.attrs["source"] = file_fingerprint(db, f"{db}-wal")
+        return import_df, SeriesIndex(MONTH_ARRAY, load)
+    if not os.path.exists("normalised_series.npy"): # Data from before the series were stored separately
+        import_df = pd.read_csv("normalised_data.csv")
+        strings = import_df.pop("time_series").to_numpy()
+        months = MonthSeries.from_records(fix_data(strings[0])).months if len(strings) else MONTH_ARRAY
+        def load(positions):
+            return np.stack([MonthSeries.from_records(fix_data(strings[x])).counts for x in positions])
+        import_df.attrs["source"] = file_fingerprint("normalised_data.csv")
+        return import_df, SeriesIndex(months, load)
+    import_df, series, months = import_matrix()
+    import_df.attrs["source"] = file_fingerprint("normalised_data.csv", "normalised_series.npy",
+                                                 "normalised_months.npy")
+    return import_df, SeriesIndex(months, lambda positions: series[positions], keep=False)
+
+# Helper function to import the data with the time series. where is a pandas query on the
+# plain columns, like "total_reviews >= 1000", which is applied before any time series are
+# read, along with min_reviews, max_reviews and type_ like filter_apps. Each game's time series
+# is a LazySeries which is only decoded when it is used, from the memory mapped array, the
+# strings of older data or the SQLite database if db is given.
+def import_data(db = "", where = None, min_reviews = None, max_reviews = None, type_ = None):
+    import_df, index = import_index(db, min_reviews, max_reviews, type_)
+    if not db:
+        import_df = filter_apps(import_df, min_reviews, max_reviews, type_)
+    if where:
+        import_df = import_df.query(where)
+    import_df["time_series"] = [LazySeries(index, x) for x in import_df.index.tolist()]
     return import_df
 
+# Stacks the time series of every game in the df into one (games, months, 2) array, and
+# returns it with the timestamps of the months. Time series from import_data are decoded
+# together, only reading the games in the df.
+def series_matrix(df: pd.DataFrame):
+    series = df["time_series"]
+    if len(series.index) == 0:
+        return np.zeros((0, len(MONTHS), 2), dtype=np.int32), MONTH_ARRAY
+    index = getattr(series.iloc[0], "index", None)
+    if isinstance(index, SeriesIndex) and all(isinstance(x, LazySeries) and x.index is index for x in series):
+        return index.matrix([x.position for x in series]), index.months
+    return np.stack([x.counts for x in series]), series.iloc[0].months
+
 # Replaces the positive review count from the data with the summed version from the time-series
 # data, which effectively applies the "exclude non-steam purchases" option
 def true_pos(data, date = dt.datetime.now(tz=TZ).timestamp()):
-    return sum(x.up for x in data if int(x.date) < date)
+    return int(data.up[data.months < date].sum())
 
 # Replaces the total review count from the data with the summed version from the time-series
 # data, which effectively applies the "exclude non-steam purchases" option
 def true_total(data, date = dt.datetime.now(tz=TZ).timestamp()):
-    return sum(x.up + x.down for x in data if int(x.date) < date)
+    return int(data.total[data.months < date].sum())
 
-# Creates the data for the review count graph. Creates buckets where the boundary for each
-# bucket is 10x higher than the previous boundary (1, 10, 100, 1000...)
-def create_review_count_data(df, step = 1, multiplier = 10, type_ = "All"):
-    results = []
+# The same as true_pos and true_total, but for every game in the df at once.
+def true_counts(df: pd.DataFrame, date = dt.datetime.now(tz=TZ).timestamp()):
+    matrix, months = series_matrix(df)
+    counts = matrix[:, months < date].sum(axis=1, dtype=np.int64)
+    return counts[:, 0], counts.sum(axis=1)
+
+# Sums the values in each group, in the same order a python loop over the rows would so the
+# sums match sum() exactly. Returns the number of rows and the sum for groups 0 to n_groups-1.
+def group_sums(groups: np.ndarray, values: np.ndarray, n_groups: int):
+    order = np.argsort(groups, kind="stable")
+    groups, values = groups[order], values[order]
+    bounds = np.searchsorted(groups, np.arange(n_groups + 1))
+    sums = [np.add.accumulate(values[start:end])[-1] if end > start else 0
+            for start, end in zip(bounds[:-1], bounds[1:])]
+    return np.diff(bounds), sums
+
+# The review score of every game in the df, as a fraction rather than a percentage. With
+# score="wilson" or "steamdb" games with only a few reviews are pulled down or towards 50%,
+# so they don't count as much as games with millions.
+def review_ratios(df: pd.DataFrame, score = "raw"):
+    positive, total = df["positive_reviews"].to_numpy(), df["total_reviews"].to_numpy()
+    if score == "wilson":
+        return stats.wilson_lower(positive, total)
+    if score == "steamdb":
+        return stats.steamdb_rating(positive, total)
+    return positive / total
+
+# Puts the games into buckets by their number of reviews, where the boundary for each bucket
+# is multiplier times higher than the previous boundary (1, 10, 100, 1000...). Returns the
+# games of the type, the boundaries, the bucket of each game and whether it is in a bucket.
+def review_count_buckets(df, step, multiplier, type_):
     if type_ != "All":
         df = df.loc[df["type"] == type_]
-    while step < MAX_R:
-        next_ = step * multiplier
-        temp_df = df.loc[(df["total_reviews"] >= step) & (df["total_reviews"] < next_)]
-        count = len(temp_df.index)
+    edges = [step]
+    while edges[-1] < MAX_R:
+        edges.append(edges[-1] * multiplier)
+    buckets = np.searchsorted(edges, df["total_reviews"].to_numpy(), side="right") - 1
+    in_range = (buckets >= 0) & (buckets < len(edges) - 1)
+    return df, edges, buckets, in_range
+
+# Creates the data for the review count graph, with the games in buckets by their number
+# of reviews.
+@cached
+def create_review_count_data(df, step = 1, multiplier = 10, type_ = "All", score = "raw"):
+    results = []
+    df, edges, buckets, in_range = review_count_buckets(df, step, multiplier, type_)
+    totals = df["total_reviews"].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        counts, score_sums = group_sums(buckets[in_range], review_ratios(df, score)[in_range], len(edges) - 1)
+    _, review_sums = group_sums(buckets[in_range], totals[in_range], len(edges) - 1)
+    for i, count in enumerate(counts):
         if count == 0:
             break
-        reviews = sum(temp_df["total_reviews"])
-        review_score = (sum(temp_df.at[i,"positive_reviews"]/temp_df.at[i,"total_reviews"]
-                            for i in temp_df.index)/len(temp_df.index))*100
-        results.append((reviews, count, review_score, f"{step:,} - {next_-1:,}"))
-        step = next_
+        review_score = (score_sums[i]/count)*100
+        results.append((int(review_sums[i]), int(count), review_score, f"{edges[i]:,} - {edges[i+1]-1:,}"))
     # Add in the data for zero reviews, and use the first review score to make the data look neat
-    temp_df = df.loc[(df["total_reviews"] == 0)]
-    reviews = sum(temp_df["total_reviews"])
-    count = len(temp_df.index)
-    results.insert(0,[reviews, count, results[0][2], "0"])
+    zero = totals == 0
+    results.insert(0,[int(totals[zero].sum()), int(zero.sum()), results[0][2], "0"])
     return results
 
-# Plots the steam review score against the number of reviews as a bar chart.
-def plot_review_count_graph(df, colour = "b", style = "o", type_ = "All", x_off=1, y_off=0):
-    data = create_review_count_data(df, type_=type_)
+# Bootstrap 95% confidence intervals for the mean review score of each bucket in
+# create_review_count_data, as (lower, upper) percentages from the first bucket on. The
+# data from create_review_count_data has the games without reviews in front of these.
+@cached
+def create_review_count_ci(df, step = 1, multiplier = 10, type_ = "All", score = "raw",
+                           resamples = stats.RESAMPLES):
+    df, edges, buckets, in_range = review_count_buckets(df, step, multiplier, type_)
+    lower, upper = stats.bootstrap_group_means(buckets[in_range], review_ratios(df, score)[in_range],
+                                               len(edges) - 1, resamples)
+    return list(zip((lower*100).tolist(), (upper*100).tolist()))
+
+# Plots the steam review score against the number of reviews as a bar chart. If resamples
+# isn't 0 the bootstrap confidence intervals are drawn as lines through the points.
+def plot_review_count_graph(ax, df, colour = "b", style = "o", type_ = "All", x_off=1, y_off=0,
+                            score = "raw", resamples = 0):
+    data = create_review_count_data(df, type_=type_, score=score)
     ax.plot([x[3] for x in data], [x[2] for x in data], colour+style)
-    ax.set(xlabel="Number of reviews", ylabel="Mean review score (% reviews positive for each game)",
+    if resamples:
+        ci = create_review_count_ci(df, type_=type_, score=score, resamples=resamples)[:len(data) - 1]
+        ax.vlines([x[3] for x in data[1:]], [x[0] for x in ci], [x[1] for x in ci], colors=colour)
+    ax.set(xlabel="Number of reviews", ylabel=f"Mean review score ({SCORES[score]} for each game)",
         title="Avg Steam review score by number of reviews")
     for y in data:
         ax.annotate(f"{type_}: {y[1]:,}",
@@ -70,59 +206,86 @@ def plot_review_count_graph(df, colour = "b", style = "o", type_ = "All", x_off=
                     xytext=(x_off,y_off), textcoords="offset points",
                     color=colour)
 
-# Creates the data for the release steam review score by release month graph.
-def create_game_time_data(df, type_ = "All"):
-    results = []
+# Finds the month each game of the type was released in. Returns the games, their month
+# and whether their first review is on the start of a month like it should be.
+def release_month_slots(df, type_):
     if type_ != "All":
         df = df.loc[df["type"] == type_]
-    for month in MONTHS:
-        temp_df = df.loc[df["review_start"] == month]
-        count = len(temp_df.index)
-        if count == 0:
-            review_score = np.nan
-        else:
-            review_score = (sum(temp_df.at[i,"positive_reviews"]/temp_df.at[i,"total_reviews"]
-                            for i in temp_df.index)/len(temp_df.index))*100
-        results.append((count, review_score))
-    return results
+    starts = df["review_start"].to_numpy(dtype=np.int64)
+    slots = np.minimum(np.searchsorted(MONTH_ARRAY, starts), len(MONTH_ARRAY) - 1)
+    return df, slots, MONTH_ARRAY[slots] == starts
+
+# Creates the data for the release steam review score by release month graph.
+@cached
+def create_game_time_data(df, type_ = "All", score = "raw"):
+    df, slots, on_month = release_month_slots(df, type_)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        counts, score_sums = group_sums(slots[on_month], review_ratios(df, score)[on_month], len(MONTH_ARRAY))
+    return [(int(count), (score_sums[i]/count)*100 if count else np.nan) for i, count in enumerate(counts)]
 
-# Plots average steam review score against the release month of the game.
-def plot_game_time_data(df, counts, type_ = "All", colour = "b", style = "o--"):
+# Bootstrap 95% confidence intervals for each month in create_game_time_data, as (lower, upper)
+# percentages, nan for months without any games.
+@cached
+def create_game_time_ci(df, type_ = "All", score = "raw", resamples = stats.RESAMPLES):
+    df, slots, on_month = release_month_slots(df, type_)
+    lower, upper = stats.bootstrap_group_means(slots[on_month], review_ratios(df, score)[on_month],
+                                               len(MONTH_ARRAY), resamples)
+    return list(zip((lower*100).tolist(), (upper*100).tolist()))
+
+# The months as numpy dates for labelling the x axis of the graphs by month. The time series
+# charts pass the months their data is on, which are only MONTH_ARRAY if it was normalised
+# this month.
+def month_labels(months = MONTH_ARRAY):
+    return np.asarray(months).astype("datetime64[s]").astype("datetime64[M]")
+
+# Labels the x axis with the dates, one every 6 months. matplotlib is only imported by the
+# functions which draw, so the data functions and --percentiles don't wait for it.
+def month_ticks(ax, dates):
+    import matplotlib.ticker as tkr
+    ax.xaxis.set_ticks(range(len(dates)))
+    ax.xaxis.set_ticklabels(dates)
+    ax.xaxis.set_major_locator(tkr.MultipleLocator(6))
+    ax.xaxis.set_minor_locator(tkr.MultipleLocator(1))
+
+# Plots average steam review score against the release month of the game. If resamples isn't
+# 0 the bootstrap confidence intervals are shaded in.
+def plot_game_time_data(ax, df, counts, type_ = "All", colour = "b", style = "o--", score = "raw",
+                        resamples = 0):
     df = df.loc[(df["total_reviews"] >= counts[0]) & (df["total_reviews"] < counts[1])]
-    data = create_game_time_data(df, type_ = type_)
-    dates = np.arange(np.datetime64('2010-10'), np.datetime64('2024-12'),
-                  np.timedelta64(1, 'M'))
+    data = create_game_time_data(df, type_ = type_, score = score)
+    dates = month_labels()
     scores = [x[1] for x in data]
     ax.plot(range(len(dates)), scores, colour+style, label=f"Games with between {counts[0]} and {counts[1]-1} reviews. ({len(df.index)} Games)")
-    ax.set(xlabel="Steam Release Month", ylabel="Mean review score (% reviews positive for each game)",
+    if resamples:
+        ci = create_game_time_ci(df, type_=type_, score=score, resamples=resamples)
+        ax.fill_between(range(len(dates)), [x[0] for x in ci], [x[1] for x in ci], color=colour, alpha=0.15)
+    ax.set(xlabel="Steam Release Month", ylabel=f"Mean review score ({SCORES[score]} for each game)",
         title="Avg Steam review score by release month")
-    while np.nan in scores: # Messy, but only affects 2 out of ~180 values so no real impact
-        i = scores.index(np.nan)
-        if i == len(scores) - 1:
-            scores[i] = scores[i-1]
-        else:
-            scores[i] = (scores[i+1]+scores[i-1])/2
-    coeff = np.polyfit(range(len(dates)), scores, 2)
+    # Months without any games are nan, which can't be found with "in" as the cached results
+    # are unpickled as new floats, so the trend is fitted to the months with games instead
+    reviewed = np.isfinite(scores)
+    coeff = np.polyfit(np.arange(len(dates))[reviewed], np.array(scores)[reviewed], 2)
     ax.plot(range(len(dates)), np.polyval(coeff, range(len(dates))), colour)
-    ax.xaxis.set_ticks(range(len(dates)))
-    ax.xaxis.set_ticklabels(dates)
-    ax.xaxis.set_major_locator(tkr.MultipleLocator(6))
-    ax.xaxis.set_minor_locator(tkr.MultipleLocator(1))
+    month_ticks(ax, dates)
 
-# Plots a histogram of steam review scores, and prints some significant milestones
-def plot_review_histogram(df, range_):
+# Creates the data for the histogram of steam review scores, and the significant milestones
+@cached
+def create_review_histogram_data(df, range_):
     df = df.loc[(df["total_reviews"] >= range_[0]) & (df["total_reviews"] < range_[1])]
-    review_scores = [(df.at[i,"positive_reviews"]/df.at[i,"total_reviews"])*100 for i in df.index]
+    review_scores = review_ratios(df)*100
     counts, bins = np.histogram(review_scores, np.arange(1, 101))
-    total = sum(counts)
-    milestones = (10,25,50,75,90)
+    total = counts.sum()
+    milestones = np.array((10,25,50,75,90))
     cumsum = np.cumsum(counts)
-    sig_ranges = "\n"
-    for i in milestones:
-        per = total * i/100
-        high = max(x for x in cumsum if x <= per)
-        idx = list(cumsum).index(high)
-        sig_ranges += f"{i}th percentile is {bins[idx]}% positive\n"
+    # The first bin where the cumulative count reaches the highest value at or below each milestone
+    highest = np.maximum(np.searchsorted(cumsum, total * milestones/100, side="right") - 1, 0)
+    idxs = np.searchsorted(cumsum, cumsum[highest], side="left")
+    sig_ranges = "\n" + "".join(f"{i}th percentile is {bins[idx]}% positive\n" for i, idx in zip(milestones, idxs))
+    return counts, bins, total, sig_ranges
+
+# Plots a histogram of steam review scores, and prints some significant milestones
+def plot_review_histogram(ax, df, range_):
+    counts, bins, total, sig_ranges = create_review_histogram_data(df, range_)
     ax.hist(bins[:-1], bins, weights=counts, histtype="bar", rwidth=0.90, cumulative=True, density=True,
             label=f"Games with between {range_[0]} and {range_[1]-1} reviews. ({total} Games)" + sig_ranges)
     ax.set(xlabel="Percent of positive reviews",
@@ -130,108 +293,427 @@ def plot_review_histogram(df, range_):
            title="CDF of positive review percentages of steam games")
 
 # Creates the data for avg review score by number of months since release
+@cached
 def create_review_score_over_time(df: pd.DataFrame):
     df = df.loc[df["total_reviews"] >= 1000]
-    deltas = {x: [] for x in range(145)}
-    for i in df.index:
-        series = [x for x in df.at[i, "time_series"] if int(x.get_date()) >= df.at[i, "review_start"]]
-        for idx, month in enumerate(series):
-            if idx > 144: #12 years, to avoid the last values being skewed by the small sample size of older games
-                break
-            score = month.get_score()
-            if score:
-                deltas[idx].append(score)
-    return [sum(v)/len(v) for v in deltas.values()]
+    matrix, months = series_matrix(df)
+    up, total = matrix[:, :, 0], matrix.sum(axis=2)
+    # How many months after the game's first review each month is
+    deltas = np.arange(len(months)) - np.searchsorted(months, df["review_start"].to_numpy())[:, None]
+    # 12 years, to avoid the last values being skewed by the small sample size of older games.
+    # Months with a score of 0 are skipped.
+    mask = (deltas >= 0) & (deltas <= 144) & (up > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = (up / total) * 100
+        sums = np.bincount(deltas[mask], weights=scores[mask], minlength=145)
+        counts = np.bincount(deltas[mask], minlength=145)
+        return (sums / counts).tolist() # nan for months after release that no game reached
 
 # Plots the steam review score against the number of months since the products release
-def plot_review_score_over_time(df: pd.DataFrame):
+def plot_review_score_over_time(ax, df: pd.DataFrame):
     data = create_review_score_over_time(df)
     ax.plot(data, "b--")
     ax.set(xlabel="Months Since release", ylabel="Average Review score (monthly)",
         title="Avg Steam review score by number of months since release. Games with over 1000 reviews")
 
+# Creates a list of how many games comprise each 10% of reviews.
+@cached
+def create_review_count_percentiles(df: pd.DataFrame):
+    results = []
+    totals = np.sort(df["total_reviews"].to_numpy())[::-1]
+    cumsum = np.cumsum(totals)
+    total = cumsum[-1] if len(cumsum) else 0
+    for j in (0.1*x for x in range(1,10)):
+        i = int(np.searchsorted(cumsum, total*j, side="right")) # The first game which takes it over j
+        if i < len(cumsum):
+            results.append((round(j*100), int(i+1), round((i+1)/len(totals)*100,3)))
+    return results
+
 # Prints a list of how many games comprise each 10% of reviews.
 def review_count_percentiles(df: pd.DataFrame):
-    total = sum(df["total_reviews"])
-    df = df.sort_values(by=["total_reviews"], ascending=False)
-    for j in (0.1*x for x in range(1,10)):
-        counter = 0
-        for i, num in enumerate(df["total_reviews"]):
-            counter += num
-            if counter > total*j:
-                print(f"{round(j*100)}% of reviews are for {i+1} games ({round((i+1)/len(df.index)*100,3)}% of all games)")
-                break
-
-# Create the data for review score by month of review graph
+    for percent, games, game_percent in create_review_count_percentiles(df):
+        print(f"{percent}% of reviews are for {games} games ({game_percent}% of all games)")
+
+# Create the data for review score by month of review graph. Returns the scores, nan for
+# months without any reviews, and the months they are for.
+@cached
 def create_all_reviews_by_month_data(df: pd.DataFrame):
-    result = []
-    series = df["time_series"]
-    for i in range(len(MONTHS)):
-        total, pos = 0, 0
-        for x in series:
-            month = x[i]
-            total += month.total
-            pos += month.up
-        result.append((pos/total)*100)
-    return result
+    matrix, months = series_matrix(df)
+    pos = matrix[:, :, 0].sum(axis=0, dtype=np.int64)
+    total = matrix.sum(axis=(0, 2), dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ((pos/total)*100).tolist(), month_labels(months)
 
-# Plots steam review score by the month of the review being made.
-def plot_all_reviews_by_month(df: pd.DataFrame, colour = "b", style = "o--"):
-    df["total_reviews"] = df["time_series"].apply(true_total)
+# Bootstrap 95% confidence intervals for each month in create_all_reviews_by_month_data, as
+# (lower, upper) percentages. The games are resampled, not the reviews, as a game's reviews
+# aren't independent of each other.
+@cached
+def create_all_reviews_by_month_ci(df: pd.DataFrame, resamples = stats.RESAMPLES):
+    matrix, _ = series_matrix(df)
+    lower, upper = stats.bootstrap_ratio_of_sums(matrix[:, :, 0], matrix.sum(axis=2), resamples)
+    return list(zip((lower*100).tolist(), (upper*100).tolist()))
+
+# Plots steam review score by the month of the review being made. If resamples isn't 0 the
+# bootstrap confidence intervals are shaded in.
+def plot_all_reviews_by_month(ax, df: pd.DataFrame, colour = "b", style = "o--", resamples = 0):
+    df = df.assign(total_reviews=true_counts(df)[1])
     df = df.loc[df["total_reviews"] >= 0]
-    scores = create_all_reviews_by_month_data(df)
-    dates = np.arange(np.datetime64('2010-10'), np.datetime64('2024-12'),
-                  np.timedelta64(1, 'M'))
+    scores, dates = create_all_reviews_by_month_data(df)
     ax.plot(range(len(dates)), scores, colour+style, label=f"{len(df.index)} Games")
+    if resamples:
+        ci = create_all_reviews_by_month_ci(df, resamples)
+        ax.fill_between(range(len(dates)), [x[0] for x in ci], [x[1] for x in ci], color=colour, alpha=0.15)
     ax.set(xlabel="Month", ylabel="Review score (% reviews positive)",
         title="Steam review score by month of review")
-    coeff = np.polyfit(range(len(dates)), scores, 2)
+    reviewed = np.isfinite(scores) # The trend is fitted to the months with reviews
+    coeff = np.polyfit(np.arange(len(dates))[reviewed], np.array(scores)[reviewed], 2)
     ax.plot(range(len(dates)), np.polyval(coeff, range(len(dates))), colour)
-    ax.xaxis.set_ticks(range(len(dates)))
-    ax.xaxis.set_ticklabels(dates)
+    month_ticks(ax, dates)
+
+# Puts every game in the df on a MonthGrid, with the month of its first review as its release.
+def month_grid(df: pd.DataFrame):
+    matrix, months = series_matrix(df)
+    release = np.minimum(np.searchsorted(months, df["review_start"].to_numpy()), len(months) - 1)
+    return MonthGrid(matrix, months, release)
+
+# Creates the data for the rolling review score graph, the score across every game of the
+# reviews made in the n months up to each month, for each n in windows. Returns the scores
+# for each n and the months they are for.
+@cached
+def create_rolling_scores(df: pd.DataFrame, windows = (1, 3, 12)):
+    total = month_grid(df).total()
+    return {n: scores(total.rolling(n)[0]).tolist() for n in windows}, month_labels(total.months)
+
+# Plots the rolling review score across every game by month of review, for each window length.
+def plot_rolling_scores(ax, df: pd.DataFrame, windows = (1, 3, 12)):
+    data, dates = create_rolling_scores(df, windows)
+    for (n, values), style in zip(data.items(), ("b:", "r-", "g-", "y-")):
+        ax.plot(range(len(values)), values, style, label=f"{n} month{'s' if n > 1 else ''} ({len(df.index)} Games)")
+    ax.set(xlabel="Month", ylabel="Review score (% reviews positive)",
+        title="Rolling Steam review score by month of review")
+    month_ticks(ax, dates)
+
+# Creates the data for the cohort chart, the review score of the reviews made each month
+# since release by the games released in each year. Cells with fewer than min_reviews reviews
+# are nan. Returns the scores as a (years, max_age+1) list and the years.
+@cached
+def create_cohort_data(df: pd.DataFrame, max_age = 120, min_reviews = 100):
+    grid = month_grid(df)
+    years = grid.months.astype("datetime64[s]").astype("datetime64[Y]").astype(np.int64) + 1970
+    totals, _ = grid.cohorts(max_age, years - years[0])
+    result = scores(totals)
+    result[totals.sum(axis=-1) < min_reviews] = np.nan
+    return result.tolist(), list(range(int(years[0]), int(years[-1]) + 1))
+
+# Plots the review score of each release year's games by months since release as a heatmap.
+def plot_cohorts(ax, df: pd.DataFrame, max_age = 120):
+    import matplotlib.ticker as tkr
+    data, years = create_cohort_data(df, max_age)
+    image = ax.imshow(np.array(data, dtype=np.float64), aspect="auto", cmap="RdYlGn", interpolation="nearest")
+    ax.figure.colorbar(image, ax=ax, label="Review score (% reviews positive)")
+    ax.set(xlabel="Months since release", ylabel="Release year",
+        title=f"Steam review score by release year and months since release ({len(df.index)} Games)")
+    ax.yaxis.set_ticks(range(len(years)))
+    ax.yaxis.set_ticklabels(years)
+    ax.xaxis.set_major_locator(tkr.MultipleLocator(12))
+
+# Creates the data for the review curve graph, the share of each game's reviews so far which
+# it had by each month since release. Only games with at least min_reviews reviews which have
+# been out for all max_age months are used. Returns the 25th, 50th and 75th percentiles
+# for each month and the number of games.
+@cached
+def create_review_curve(df: pd.DataFrame, max_age = 60, min_reviews = 1000):
+    grid = month_grid(df.loc[df["total_reviews"] >= min_reviews])
+    counts, observed = grid.ages(max_age)
+    lifetime = grid.window(grid.release, len(grid.months)).sum(axis=-1)
+    full = observed[:, -1] & (lifetime > 0)
+    if not full.any():
+        return [[np.nan] * (max_age + 1)] * 3, 0
+    shares = np.cumsum(counts[full].sum(axis=-1), axis=1) / lifetime[full, None] * 100
+    return np.percentile(shares, [25, 50, 75], axis=0).tolist(), int(full.sum())
+
+# Plots the median share of their reviews games have by each month since release, with the
+# middle half of games shaded in.
+def plot_review_curve(ax, df: pd.DataFrame, max_age = 60):
+    import matplotlib.ticker as tkr
+    (lower, median, upper), games = create_review_curve(df, max_age)
+    ax.plot(median, "b-", label=f"Median ({games} Games with over 1000 reviews, out for {max_age} months)")
+    ax.fill_between(range(len(median)), lower, upper, color="b", alpha=0.15, label="25th to 75th percentile")
+    ax.set(xlabel="Months since release", ylabel="% of reviews so far",
+        title="Share of a game's reviews by months since release")
     ax.xaxis.set_major_locator(tkr.MultipleLocator(6))
-    ax.xaxis.set_minor_locator(tkr.MultipleLocator(1))
 
-# Time df has the time-series data, but makes the program take much longer to run,
-# so use simple_df if you don't need it.
-# time_df = import_data()
-# simple_df = pd.read_csv("data.csv")
+# Plots the share of the downloaded reviews whose text scored a positive sentiment by the month of
+# the review, against the share of the same reviews which were voted up. The dfs are from
+# textstats.text_frame, so months without any downloaded reviews are left as gaps.
+def plot_text_sentiment(ax, sentiment_df: pd.DataFrame, vote_df: pd.DataFrame):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sentiment, dates = create_all_reviews_by_month_data(sentiment_df)
+        votes, _ = create_all_reviews_by_month_data(vote_df)
+    ax.plot(range(len(dates)), sentiment, "bo--", label=f"Positive text ({len(sentiment_df.index)} Games)")
+    ax.plot(range(len(dates)), votes, "rx--", label="Voted up")
+    ax.set(xlabel="Month", ylabel="% of reviews",
+        title="Sentiment of review text by month of review")
+    month_ticks(ax, dates)
+
+# Loads the data the charts need the first time it is used, so it is only loaded once
+# however many charts use it.
+class Dataset:
+    '''
+    Dataset(steam_only: bool, db: str, score: str, resamples: int, where: str)
+
+    The data for the charts. simple_df is data.csv and time_df is the normalised data
+    with the time series, both read from the SQLite database instead if db is given.
+    If steam_only is True the review counts in time_df are replaced by the sums of
+    the time series, which excludes non-steam reviews. score is how the charts score
+    each game, from SCORES, and resamples is how many bootstrap resamples to work out
+    their confidence intervals with, 0 for none. where is a pandas query the games in
+    time_df are filtered by before their time series are read.
+    '''
+    def __init__(self, steam_only = False, db = "", score = "raw", resamples = 0, where = None):
+        self.steam_only = steam_only
+        self.db = db
+        self.score = score
+        self.resamples = resamples
+        self.where = where
+        self._simple_df = None
+        self._time_df = None
+        self._apps = {}
+        self._time_data = {}
 
-# Uncomment these two lines if you want to exclude non-steam reviews.
-# df["positive_reviews"] = df["time_series"].apply(true_pos)
-# df["total_reviews"] = df["time_series"].apply(true_total)
+    @property
+    def pushdown(self):
+        '''
+        Whether apps and time_data filter in the database. Not with steam_only, as the
+        review counts they filter on are replaced by the sums of the time series.
+        '''
+        return bool(self.db) and not self.steam_only
+
+    @property
+    def simple_df(self):
+        '''
+        The data from data.csv, without the time series.
+        '''
+        if self._simple_df is None and self.db:
+            from store import Store
+            with Store(self.db) as store:
+                self._simple_df = store.read_apps()
+        elif self._simple_df is None:
+            self._simple_df = pd.read_csv("data.csv")
+        return self._simple_df
+
+    @property
+    def time_df(self):
+        '''
+        The normalised data with the time series.
+        '''
+        if self._time_df is None:
+            self._time_df = import_data(self.db, self.where)
+            if self.steam_only:
+                self._time_df["positive_reviews"], self._time_df["total_reviews"] = true_counts(self._time_df)
+        return self._time_df
+
+    def apps(self, min_reviews = None, max_reviews = None, type_ = None):
+        '''
+        The games in simple_df with min_reviews to max_reviews-1 reviews of the type.
+        With a database they are read with its indexes, so only those games are loaded.
+
+        Returns:
+        pd.DataFrame
+        '''
+        if not self.pushdown or self._simple_df is not None:
+            return filter_apps(self.simple_df, min_reviews, max_reviews, type_)
+        key = (min_reviews, max_reviews, type_)
+        if key not in self._apps:
+            from store import Store
+            with Store(self.db) as store:
+                self._apps[key] = store.read_apps(min_reviews, max_reviews, type_)
+        return self._apps[key]
+
+    def time_data(self, min_reviews = None, max_reviews = None, type_ = None):
+        '''
+        The same as apps for time_df, only reading the time series of those games.
+
+        Returns:
+        pd.DataFrame
+        '''
+        if not self.pushdown or self._time_df is not None:
+            return filter_apps(self.time_df, min_reviews, max_reviews, type_)
+        key = (min_reviews, max_reviews, type_)
+        if key not in self._time_data:
+            self._time_data[key] = import_data(self.db, self.where, min_reviews, max_reviews, type_)
+        return self._time_data[key]
 
-fig, ax = plt.subplots()
 
 # Graphs for Game/DLC/All reviews by number of reviews
-# simple_df = simple_df.loc[(df["total_reviews"] > 0) & (simple_df["total_reviews"] < 1000000)]
-# plot_review_count_graph(simple_df, x_off=-50, y_off=5)
-# plot_review_count_graph(simple_df, colour = "r", style="x", type_ = "Game",  x_off=5, y_off=0)
-# plot_review_count_graph(simple_df, colour = "g", style="x", type_ = "DLC", y_off=5)
+def chart_review_count(data, ax):
+    simple_df = data.apps(1, 1000000)
+    options = {"score": data.score, "resamples": data.resamples}
+    plot_review_count_graph(ax, simple_df, x_off=-50, y_off=5, **options)
+    plot_review_count_graph(ax, simple_df, colour = "r", style="x", type_ = "Game",  x_off=5, y_off=0, **options)
+    plot_review_count_graph(ax, simple_df, colour = "g", style="x", type_ = "DLC", y_off=5, **options)
 
 # Graphs for game review score by release date
-# plot_game_time_data(time_df, (10, 1000)) # total_reviews >= 10
-# plot_game_time_data(time_df, (100, 1000), colour="r", style="x--")
-# plot_game_time_data(time_df, (1000, 10000), colour="g", style="x--")
-# plot_game_time_data(time_df, (10000, 10000000), colour="y", style="x--")
+def chart_release_date(data, ax):
+    options = {"score": data.score, "resamples": data.resamples}
+    for counts, colour, style in [((10, 1000), "b", "o--"), ((100, 1000), "r", "x--"),
+                                  ((1000, 10000), "g", "x--"), ((10000, 10000000), "y", "x--")]:
+        plot_game_time_data(ax, data.time_data(*counts), counts, colour=colour, style=style, **options)
 
 # Histogram of review scores
-# plot_review_histogram(simple_df, (10, 1000))
-# plot_review_histogram(simple_df, (1000, 10000000))
+def chart_histogram(data, ax):
+    plot_review_histogram(ax, data.apps(10, 1000), (10, 1000))
+    plot_review_histogram(ax, data.apps(1000, 10000000), (1000, 10000000))
 
 # Monthly review score by months since release date
-# plot_review_score_over_time(time_df)
-
-# Number of games by percentile of reviews
-# review_count_percentiles(simple_df)
+def chart_months_after_release(data, ax):
+    plot_review_score_over_time(ax, data.time_data(1000))
 
 # Review score across all games by month of review being made.
-# plot_all_reviews_by_month(time_df)
+def chart_review_month(data, ax):
+    plot_all_reviews_by_month(ax, data.time_data(), resamples=data.resamples)
+
+# Review text sentiment by month, from the results of textstats.py
+def chart_text_sentiment(data, ax):
+    from textstats import text_frame
+    plot_text_sentiment(ax, text_frame(sentiment=True), text_frame(sentiment=False))
+
+# Rolling 1, 3 and 12 month review score across all games.
+def chart_rolling_score(data, ax):
+    plot_rolling_scores(ax, data.time_data())
+
+# Review score of each release year by months since release.
+def chart_cohorts(data, ax):
+    plot_cohorts(ax, data.time_data())
+
+# Share of a game's reviews it has by each month since release.
+def chart_review_curve(data, ax):
+    plot_review_curve(ax, data.time_data(1000))
+
+
+# The charts which can be made, with the name of the file they are saved to and whether
+# they need the time series.
+CHARTS = {
+    "review-count": (chart_review_count, "Steam review score by review count", False),
+    "release-date": (chart_release_date, "Steam Review score by release date", True),
+    "histogram": (chart_histogram, "Steam review score histogram", False),
+    "months-after-release": (chart_months_after_release, "Steam Review score by months after release", True),
+    "review-month": (chart_review_month, "Review Score by month review was made", True),
+    "text-sentiment": (chart_text_sentiment, "Review text sentiment by month", False),
+    "rolling-score": (chart_rolling_score, "Rolling review score by month", True),
+    "cohorts": (chart_cohorts, "Review score by release year and months since release", True),
+    "review-curve": (chart_review_curve, "Share of reviews by months since release", True),
+}
+# The charts made when none are asked for. text-sentiment needs textstats.py to have been run
+# on reviews from review-text.py, which most people won't have, so it has to be asked for.
+DEFAULT_CHARTS = [name for name in CHARTS if name != "text-sentiment"]
+
+# Set before the worker processes are started, so they share the loaded data.
+DATA = None
+
+# Draws one chart and saves it to out_dir, returning the path. Run in the worker processes
+# when there is more than one, which load the data themselves from the same options if they
+# weren't forked. If profile is True the chart is profiled into profiles/.
+def render_chart(name, out_dir = "imgs", fmt = "png", profile = False, db = "", score = "raw", resamples = 0,
+                 where = None, steam_only = False, use_cache = True):
+    import matplotlib.pyplot as plt
+    global DATA
+    cache.enabled = use_cache
+    if DATA is None:
+        DATA = Dataset(steam_only, db, score, resamples, where)
+    func, filename, _ = CHARTS[name]
+    fig, ax = plt.subplots(figsize=(16, 9))
+    with profiled(f"chart-{name}", profile):
+        func(DATA, ax)
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend()
+    path = os.path.join(out_dir, f"{filename}.{fmt}")
+    fig.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+    return path
+
 
 # Other ideas:
     # Some more complex stat stuff?
     # Tidy everything up and add some doc strings.
     # Make a github pages showing everything in a neat fashion.
 
-ax.legend()
-plt.show()
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("charts", nargs="*", default=None,
+                        help=f"The charts to make, from {', '.join(CHARTS)}. Defaults to all of them "
+                             "except text-sentiment, or none with --percentiles")
+    parser.add_argument("-o", "--out", action="store", dest="out", default="imgs",
+                        help="Folder to save the charts in")
+    parser.add_argument("-f", "--format", action="store", dest="format", default="png",
+                        choices=["png", "svg", "pdf"], help="File format of the charts")
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=1,
+                        help="Number of processes to draw the charts with")
+    parser.add_argument("--steam-only", action="store_true", dest="steam_only",
+                        help="Exclude reviews from outside of steam")
+    parser.add_argument("--percentiles", action="store_true", dest="percentiles",
+                        help="Print how many games comprise each 10%% of reviews")
+    parser.add_argument("--show", action="store_true", dest="show",
+                        help="Show the charts in a window instead of saving them")
+    parser.add_argument("--no-cache", action="store_true", dest="no_cache",
+                        help="Work everything out again instead of using the cache")
+    parser.add_argument("--profile", action="store_true", dest="profile",
+                        help="Profile loading the data and each chart with cProfile and tracemalloc, "
+                             "writing the results to profiles/")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Read the data from this SQLite database from store.py instead of the files")
+    parser.add_argument("--score", action="store", dest="score", default="raw", choices=list(SCORES),
+                        help="How to score each game: the raw %% of reviews positive, the lower bound of its "
+                             "Wilson score interval or its SteamDB rating. The last two count games with "
+                             "few reviews for less")
+    parser.add_argument("--ci", action="store", dest="ci", type=int, default=0,
+                        help="Draw 95%% bootstrap confidence intervals with this many resamples, e.g. 1000")
+    parser.add_argument("--where", action="store", dest="where", default=None,
+                        help="Only use the games matching this pandas query for the time series charts, "
+                             "e.g. \"total_reviews >= 1000\". The other games' time series aren't read")
+    args = parser.parse_args()
+    if not args.charts:
+        args.charts = [] if args.percentiles else DEFAULT_CHARTS
+
+    unknown = [name for name in args.charts if name not in CHARTS]
+    if unknown:
+        parser.error(f"Unknown charts {', '.join(unknown)}, choose from {', '.join(CHARTS)}")
+    if "text-sentiment" in args.charts:
+        from textstats import TEXT_DIR
+        if not os.path.exists(os.path.join(TEXT_DIR, "text_grid.npy")):
+            parser.error(f"text-sentiment needs the results of textstats.py in {TEXT_DIR}/, run it first")
+    cache.enabled = not args.no_cache
+
+    # Load the data once up front, the worker processes get a copy when they start.
+    DATA = Dataset(args.steam_only, args.db, args.score, args.ci, args.where)
+    if args.percentiles:
+        review_count_percentiles(DATA.simple_df)
+    if any(CHARTS[name][2] for name in args.charts) and not DATA.pushdown:
+        with profiled("import_data", args.profile):
+            DATA.time_df # Load it now so the workers share it, the database only reads what each chart needs
+    if args.show and args.charts:
+        import matplotlib.pyplot as plt
+        for name in args.charts:
+            fig, ax = plt.subplots()
+            with profiled(f"chart-{name}", args.profile):
+                CHARTS[name][0](DATA, ax)
+            if ax.get_legend_handles_labels()[0]:
+                ax.legend()
+        plt.show()
+    elif args.charts:
+        import matplotlib
+        matplotlib.use("Agg") # Before pyplot is imported, so it doesn't look for a window system
+        os.makedirs(args.out, exist_ok=True)
+        if args.workers > 1 and len(args.charts) > 1:
+            # Forked workers start with the data already loaded, otherwise they load it themselves
+            with ProcessPoolExecutor(max_workers=args.workers, mp_context=worker_context()) as pool:
+                render = partial(render_chart, out_dir=args.out, fmt=args.format, profile=args.profile,
+                                 db=args.db, score=args.score, resamples=args.ci, where=args.where,
+                                 steam_only=args.steam_only, use_cache=not args.no_cache)
+                for path in pool.map(render, args.charts):
+                    print(f"Saved {path}")
+        else:
+            for name in args.charts:
+                path = render_chart(name, args.out, args.format, args.profile, args.db, args.score, args.ci,
+                                    args.where, args.steam_only, not args.no_cache)
+                print(f"Saved {path}")
@@ -0,0 +1,205 @@
+from argparse import ArgumentParser
+import glob
+import json
+import multiprocessing as mp
+import os
+import resource
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+SIZES = [1000, 10000, 100000, 200000]
+# The modules and scripts whose import time is measured. The scripts only do their work
+# when run as __main__, so importing them is the start up time before they parse their
+# arguments, which every run and every spawned worker process pays.
+IMPORTS = ["utils", "fetcher", "stats", "monthgrid", "store", "analysis", "textstats", "review-getter.py",
+           "review-timeseries.py", "data-normaliser.py", "analysis.py"]
+BASELINE = "bench_baseline.json"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs one of the pipeline scripts the same way as from the command line.
+def run_script(name, *argv):
+    sys.argv = [name, *argv]
+    runpy.run_path(os.path.join(HERE, name), run_name="__main__")
+
+# Loads the data the analysis aggregates need, before the timer starts.
+def analysis_data():
+    import analysis
+    import pandas as pd
+    analysis.cache.enabled = False
+    return analysis, pd.read_csv("data.csv"), analysis.import_data()
+
+# Makes the time series strings normalised_data.csv used to have, for timing fix_data.
+def legacy_strings():
+    import numpy as np
+    series = np.load("normalised_series.npy")
+    months = np.load("normalised_months.npy")
+    return ["[" + ", ".join(f"{m}: UP {u} DOWN {d}" for m, (u, d) in zip(months, row.tolist())) + "]"
+            for row in series]
+
+# Each stage has a setup function run before the timer starts, whose result is passed to
+# the timed function. Stages run in order as the later ones use the earlier ones' files.
+def stage_csvmaker():
+    os.makedirs("csvmaker", exist_ok=True)
+    for path in glob.glob("*data*.json"):
+        if not os.path.exists(os.path.join("csvmaker", path)):
+            os.symlink(os.path.abspath(path), os.path.join("csvmaker", path))
+    os.chdir("csvmaker")
+    return None
+
+def stage_fix_data():
+    import analysis
+    return analysis, legacy_strings()
+
+STAGES = {
+    "csvmaker": (stage_csvmaker, lambda _: run_script("csvmaker.py")),
+    "normaliser": (lambda: None, lambda _: run_script("data-normaliser.py")),
+    "fix_data": (stage_fix_data, lambda x: [x[0].fix_data(s) for s in x[1]]),
+    "import_data": (lambda: __import__("analysis"), lambda analysis: analysis.import_data()),
+    "create_review_count_data": (analysis_data, lambda x: x[0].create_review_count_data(
+        x[1].loc[x[1]["total_reviews"] > 0])),
+    "create_game_time_data": (analysis_data, lambda x: x[0].create_game_time_data(x[2])),
+    "create_review_histogram_data": (analysis_data, lambda x: x[0].create_review_histogram_data(
+        x[1], (10, 1000))),
+    "create_review_score_over_time": (analysis_data, lambda x: x[0].create_review_score_over_time(x[2])),
+    "create_review_count_percentiles": (analysis_data, lambda x: x[0].create_review_count_percentiles(x[1])),
+    "create_all_reviews_by_month_data": (analysis_data, lambda x: x[0].create_all_reviews_by_month_data(x[2])),
+}
+
+# Imports a module or a script without running it.
+def import_module(name):
+    if name.endswith(".py"):
+        runpy.run_path(os.path.join(HERE, name), run_name="bench_import")
+    else:
+        __import__(name)
+
+# Runs a stage in the worker process and sends back how long it took and the peak memory.
+def run_stage(name, work_dir, conn):
+    sys.path.insert(0, HERE)
+    os.chdir(work_dir)
+    setup, func = STAGES[name] if name in STAGES else (lambda: None, lambda _: import_module(name))
+    data = setup()
+    start = time.perf_counter()
+    func(data)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on linux
+    conn.send({"seconds": round(seconds, 4), "peak_rss_mb": round(peak, 1)})
+    conn.close()
+
+# Runs every stage for a catalogue of the given size. Each stage gets a fresh process so
+# its peak memory is its own. The normaliser always runs if a later stage needs its
+# files, but only gets reported if it was asked for.
+def bench_size(size, work_dir, stages, seed = 0):
+    sys.path.insert(0, HERE)
+    from synthetic import write_catalogue
+    write_catalogue(size, work_dir, seed)
+    results = {}
+    context = mp.get_context("spawn")
+    to_run = stages
+    if "normaliser" not in stages and set(stages) - {"csvmaker"}:
+        to_run = ["normaliser", *stages]
+    for name in to_run:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_stage, args=(name, work_dir, sender))
+        process.start()
+        sender.close()
+        try:
+            results[name] = receiver.recv()
+        except EOFError:
+            results[name] = {"error": "stage crashed"}
+        process.join()
+        if name in stages:
+            print(f"{size:>7} apps  {name:<34} {results[name]}")
+    return {name: results[name] for name in stages}
+
+# Times importing each module, in a fresh process each as the first import of anything is
+# what's slow, the same way as the stages so the results can go in the baseline.
+def bench_imports(names, work_dir):
+    results = {}
+    context = mp.get_context("spawn")
+    for name in names:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_stage, args=(name, work_dir, sender))
+        process.start()
+        sender.close()
+        try:
+            results[name] = receiver.recv()
+        except EOFError:
+            results[name] = {"error": "import crashed"}
+        process.join()
+        print(f"{'import':>12}  {name:<34} {results[name]}")
+    return results
+
+# Compares the results to the baseline, returning the stages which got slower or used
+# more memory by more than the tolerance.
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or "error" in base:
+                continue
+            if "error" in result:
+                regressions.append(f"{size} apps {name}: {result['error']}")
+                continue
+            for measure in ("seconds", "peak_rss_mb"):
+                if result[measure] > base[measure] * (1 + tolerance):
+                    regressions.append(f"{size} apps {name}: {measure} {base[measure]} -> {result[measure]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-s", "--sizes", nargs="*", type=int, default=SIZES,
+                        help="Catalogue sizes to benchmark, give it none to only time the imports")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES),
+                        help="Stages to benchmark, defaults to all of them")
+    parser.add_argument("--imports", nargs="*", default=IMPORTS,
+                        help="Modules and scripts to time importing, defaults to the main ones. Give it no "
+                             "names to skip timing them")
+    parser.add_argument("-b", "--baseline", action="store", dest="baseline", default=BASELINE,
+                        help="File with the baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", dest="save_baseline",
+                        help="Save these results as the new baseline")
+    parser.add_argument("-t", "--tolerance", action="store", dest="tolerance", type=float, default=0.25,
+                        help="How much slower or bigger than the baseline counts as a regression")
+    parser.add_argument("-o", "--out", action="store", dest="out", default="",
+                        help="File to write the results to as json")
+    parser.add_argument("--keep", action="store_true", dest="keep",
+                        help="Keep the generated data instead of deleting it")
+    args = parser.parse_args()
+
+    results = {}
+    if args.imports:
+        work_dir = tempfile.mkdtemp(prefix="steam-bench-imports-")
+        try:
+            results["imports"] = bench_imports(args.imports, work_dir)
+        finally:
+            shutil.rmtree(work_dir)
+    for size in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"steam-bench-{size}-")
+        try:
+            results[str(size)] = bench_size(size, work_dir, args.stages)
+        finally:
+            if args.keep:
+                print(f"Data for {size} apps is in {work_dir}")
+            else:
+                shutil.rmtree(work_dir)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
@@ -0,0 +1,123 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import pandas as pd
+
+CACHE_DIR = ".analysis_cache"
+MAX_BYTES = 512 * 1024 * 1024
+MAX_ENTRIES = 500
+enabled = True
+# Part of every key, so results from before a change are never used again. The code of the
+# cached function itself is in the key too, so this only needs bumping when something it
+# calls changes what it returns.
+CACHE_VERSION = 1
+
+# Fingerprints the files some data was loaded from by their path, size and modified time.
+def file_fingerprint(*paths):
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            h.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+# Fingerprints a dataframe. The plain columns are hashed so filtering or changing them gives
+# a new fingerprint. The time series come from the files in df.attrs["source"] if
+# import_data set it, otherwise they are hashed too.
+def frame_fingerprint(df: pd.DataFrame):
+    h = hashlib.sha1()
+    simple_df = df.drop(columns="time_series", errors="ignore")
+    h.update(repr(simple_df.columns.to_list()).encode())
+    h.update(pd.util.hash_pandas_object(simple_df, index=True).to_numpy().tobytes())
+    if "time_series" in df.columns:
+        if "source" in df.attrs:
+            h.update(df.attrs["source"].encode())
+        else:
+            for series in df["time_series"]:
+                h.update(series.counts.tobytes())
+    return h.hexdigest()
+
+# Adds a function's bytecode and constants to a hash, going into the functions defined inside
+# it, so changing the function's body or any number or string in it changes the hash.
+def hash_code(h, code):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            hash_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+# Makes the cache key for a call from the cache version, the function's name and code, and
+# its arguments.
+def make_key(func, args, kwargs):
+    h = hashlib.sha1(f"{CACHE_VERSION}:{func.__module__}.{func.__qualname__}".encode())
+    hash_code(h, func.__code__)
+    for name, arg in list(enumerate(args)) + sorted(kwargs.items()):
+        if isinstance(arg, pd.DataFrame):
+            arg = frame_fingerprint(arg)
+        h.update(f"{name}={arg!r};".encode())
+    return h.hexdigest()
+
+# Removes the least recently used results until the cache is under its size limits. Other
+# processes can be evicting at the same time, so results which have already gone are skipped.
+def evict():
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".pkl"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    size = sum(entry[1] for entry in entries)
+    while entries and (size > MAX_BYTES or len(entries) > MAX_ENTRIES):
+        _, entry_size, path = entries.pop(0)
+        size -= entry_size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Decorator which stores the result of an aggregate function on disk, so calling it again
+# with the same data and arguments loads the result instead of working it out again.
+def cached(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        path = os.path.join(CACHE_DIR, f"{make_key(func, args, kwargs)}.pkl")
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+        else:
+            try:
+                os.utime(path) # Mark it as recently used
+            except FileNotFoundError: # Evicted by another process since it was loaded
+                pass
+            return result
+        result = func(*args, **kwargs)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Each writer gets its own temporary file, so processes working out the same result
+        # don't write over each other's before it is moved into place.
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=CACHE_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        evict()
+        return result
+    return wrapper
+
+# Deletes everything in the cache.
+def clear():
+    if os.path.exists(CACHE_DIR):
+        for entry in os.scandir(CACHE_DIR):
+            os.remove(entry.path)
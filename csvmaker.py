@@ -1,18 +1,112 @@
+from argparse import ArgumentParser
+import glob
 import json
+import re
 import pandas as pd
+from journal import write_atomic
 
-# Turns the data from the various json files into one big csv
-def get_data(app_list: list, filename: str, filecount: int):
-    for i in range(filecount):
-        with open(f"{filename}{i}.json", "r", encoding="utf-8") as f:
-            data = json.loads(f.read())
-            app_list += data["response"]["apps"]
-    return app_list
+COLUMNS = ["appid", "name", "last_modified", "price_change_number", "type"]
+CHUNK_SIZE = 10000
 
+# Finds the files AppIDList.py made with the given name, in the order they were made.
+def find_pages(filename: str):
+    pages = []
+    for path in glob.glob(f"{filename}*.json"):
+        number = re.fullmatch(rf"{re.escape(filename)}(\d+)\.json", path)
+        if number:
+            pages.append((int(number.group(1)), path))
+    return [path for _, path in sorted(pages)]
 
-apps = get_data([], "DLCdata", 5) # Change the last number in these two functions to
-apps = get_data(apps, "gamedata", 12) # How many files of each type you have
+# Reads the pages one at a time and yields their text.
+def read_pages(paths: list):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            yield f.read()
 
-df = pd.DataFrame(data=apps, columns=["appid", "name"])
+# Yields every app in the pages with its type attached, only holding one page at a time.
+def get_data(pages, type_: str):
+    for text in pages:
+        for app in json.loads(text)["response"].get("apps", []):
+            app["type"] = type_
+            yield app
 
-df.to_csv("data.csv", index=False)
+# Yields the apps in chunks of DataFrames with the columns for data.csv.
+def chunk_apps(apps):
+    chunk = []
+    for app in apps:
+        chunk.append(app)
+        if len(chunk) == CHUNK_SIZE:
+            yield pd.DataFrame(data=chunk, columns=COLUMNS)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(data=chunk, columns=COLUMNS)
+
+# Writes the apps to a csv a chunk at a time, so memory doesn't grow with the number of apps.
+def write_apps(apps, path: str):
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk_df in enumerate(chunk_apps(apps)):
+            chunk_df.to_csv(f, index=False, header=i == 0)
+            count += len(chunk_df.index)
+        if count == 0:
+            pd.DataFrame(columns=COLUMNS).to_csv(f, index=False)
+    return count
+
+# Merges the apps from the delta files into the existing data. Apps we already have get
+# their details updated, anything new is added to the end ready for review-getter.py.
+def merge_data(df: pd.DataFrame, delta_df: pd.DataFrame):
+    delta_df = delta_df.drop_duplicates(subset="appid", keep="last").set_index("appid")
+    df = df.set_index("appid")
+    if "type" not in df.columns: # Made before csvmaker.py added the types
+        delta_df = delta_df.drop(columns="type")
+    for column in delta_df.columns:
+        if column not in df.columns:
+            df[column] = 0
+    existing = delta_df.index.intersection(df.index)
+    df.loc[existing, delta_df.columns] = delta_df.loc[existing]
+    new_df = delta_df.loc[delta_df.index.difference(df.index)]
+    return pd.concat([df, new_df]).reset_index()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-m", "--merge", action="store_true", dest="merge",
+                        help="Merge the gamedelta and DLCdelta files from AppIDList.py --since into data.csv")
+    parser.add_argument("-k", "--key", action="store", dest="key", default="",
+                        help="Get the pages straight from the steam API with this key instead of from files")
+    parser.add_argument("-s", "--since", action="store", dest="since", default="",
+                        help="With --key and --merge or --db, only get apps changed since this timestamp or ISO date")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Add the apps to this SQLite database from store.py instead of data.csv")
+    args = parser.parse_args()
+    # Only the changed apps are fetched, so writing them over data.csv would lose the rest
+    if args.since and not (args.key and (args.merge or args.db)):
+        parser.error("--since needs --key, and --merge or --db so the changed apps are merged in")
+
+    if args.key:
+        from AppIDList import app_params, iter_pages, parse_since
+        since = parse_since(args.since) if args.since else None
+        dlc_pages = iter_pages(app_params(args.key, dlc=True, since=since))
+        game_pages = iter_pages(app_params(args.key, since=since))
+    else:
+        prefix = "delta" if args.merge else "data"
+        dlc_pages = read_pages(find_pages(f"DLC{prefix}"))
+        game_pages = read_pages(find_pages(f"game{prefix}"))
+    apps = (app for pages in ((dlc_pages, "DLC"), (game_pages, "Game")) for app in get_data(*pages))
+
+    if args.db:
+        from store import Store
+        # Apps are added or updated in place, so merging is the same as a full run
+        with Store(args.db) as store:
+            count = sum(store.upsert_apps(chunk_df) for chunk_df in chunk_apps(apps))
+        print(f"Added or updated {count} apps in {args.db}")
+    elif args.merge:
+        chunks = list(chunk_apps(apps))
+        delta_df = pd.concat(chunks) if chunks else pd.DataFrame(columns=COLUMNS)
+        df = merge_data(pd.read_csv("data.csv"), delta_df)
+        write_atomic("data.csv", lambda path: df.to_csv(path, index=False))
+        print(f"Merged {len(delta_df.index)} changed apps into data.csv")
+    else:
+        def write(path):
+            print(f"Wrote {write_apps(apps, path)} apps to data.csv")
+        write_atomic("data.csv", write)
@@ -1,9 +1,14 @@
-import datetime as dt
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import numpy as np
 import pandas as pd
-from utils import MonthlyRecommends, MONTHS
+from metrics import Metrics, profiled
+from utils import MONTH_ARRAY, MONTHS, month_slots, worker_context
 
-df = pd.read_json("time_data.json")
-tz = dt.UTC
+DAY = 86400
+CHUNK_SIZE = 10000
 
 # The steam review histogram shows the number of reviews for each month, with the month
 # being identified by a string of the unix timestamp at midnight UCT on the 1st of each month
@@ -20,73 +25,128 @@ tz = dt.UTC
 # Weeks are done with the week starting on the day of the week of the game's release, identified
 # by midnight UTC for that day.
 
-# Checks to see if the data is in weekly mode or monthly mode
-def check_weekly(data):
-    timestamps = [dt.datetime.fromtimestamp(int(x["date"]),tz=tz) for x in data]
-    deltas = [timestamps[n] - timestamps[n-1] for n in range(1,len(data))]
-    if all(x == dt.timedelta(days=7) for x in deltas):
-        return True
-    return False
+# Normalises the time series for a list of games at once, returning a (games, months, 2)
+# array of the up and down counts. Every weekly or monthly point is moved into the month
+# it starts in, unless the week runs into the next month. Then the reviews are split
+# between the two months by the number of days of the week in each, rounded the same
+# way round() does.
+def normalise_month_data(series: list):
+    lengths = np.fromiter((len(x) for x in series), dtype=np.int64, count=len(series))
+    points = list(chain.from_iterable(series))
+    games = np.repeat(np.arange(len(series)), lengths)
+    dates = np.fromiter((int(x["date"]) for x in points), dtype=np.int64, count=len(points))
+    up = np.fromiter((int(x["recommendations_up"]) for x in points), dtype=np.int64, count=len(points))
+    down = np.fromiter((int(x["recommendations_down"]) for x in points), dtype=np.int64, count=len(points))
 
-# Moves the weekly data into monthly data, returning one or two months as necessary
-def move_weekly_data(data):
-    date = data["date"]
-    up, down = int(data["recommendations_up"]), int(data["recommendations_down"])
-    timestamp = dt.datetime.fromtimestamp(int(date))
-    six_days = timestamp + dt.timedelta(days=6)
-    if timestamp.month == six_days.month:
-        return (MonthlyRecommends(date, up, down),None)
-    change_day = 0
-    for i in range(1,7):
-        new_date = timestamp+dt.timedelta(days=i)
-        if timestamp.month != new_date.month:
-            change_day = i
-            break
-    if change_day == 0:
-        print("change date is 0, something has gone wrong")
-    month1 = MonthlyRecommends(date, round(up*(change_day/7)), round(down*(change_day/7)))
-    new_date = timestamp + dt.timedelta(days=change_day)
-    month2 = MonthlyRecommends(int(new_date.timestamp()), round(up*((7-change_day)/7)),
-                               round(down*((7-change_day)/7)))
-    return (month1, month2)
+    # The day of the week the month changes on, 7 or more if the week is all in one month
+    next_month = (dates.astype("datetime64[s]").astype("datetime64[M]") + 1).astype("datetime64[s]")
+    change_day = np.ceil((next_month.astype(np.int64) - dates) / DAY).astype(np.int64)
+    split = change_day < 7
+    first = np.where(split, change_day, 7) / 7
+    second = np.where(split, 7 - change_day, 0) / 7
 
+    result = np.zeros((len(series), len(MONTHS), 2), dtype=np.int64)
+    second_slots = month_slots(dates[split] + change_day[split] * DAY)
+    for col, counts in enumerate((up, down)):
+        np.add.at(result, (games, month_slots(dates), col), np.round(counts * first).astype(np.int64))
+        np.add.at(result, (games[split], second_slots, col), np.round(counts[split] * second[split]).astype(np.int64))
+    return result.astype(np.int32)
 
-def normalise_month_data(data):
-    new_data = []
-    timestamps = [int(x["date"]) for x in data]
-    if all(x in MONTHS for x in timestamps):
-        for date in MONTHS:
-            if date in timestamps:
-                monthly = data[timestamps.index(date)]
-                new_data.append(
-                    MonthlyRecommends(monthly["date"],
-                                      int(monthly["recommendations_up"]),
-                                      int(monthly["recommendations_down"])
-                    )
-                )
-            else:
-                new_data.append(MonthlyRecommends(date, 0, 0))
-        return sorted(new_data)
-    for point in data:
-        month1, month2 = move_weekly_data(point)
-        for month in (month1, month2):
-            if month and month not in new_data:
-                new_data.append(month)
-            elif month:
-                new_data[new_data.index(month)] += month
-    for month in MONTHS:
-        if month not in timestamps and month not in [int(x.get_date()) for x in new_data]:
-            new_data.append(MonthlyRecommends(month, 0, 0))
-    return sorted(new_data)
 
+# Moves the start of each game's reviews to the start of the month it is in.
+def normalise_review_start_data(dates: np.ndarray):
+    return MONTH_ARRAY[month_slots(dates)]
 
-def normalise_review_start_data(date: int):
-    if date not in MONTHS:
-        date = max(month for month in MONTHS if month < date)
-    return date
 
+# Splits the series into chunks and normalises them, on a pool of worker processes if
+# workers is more than 1. Only the plain dicts from the json go to the workers and only
+# the arrays of counts come back. The chunks are yielded in order as (start row, counts).
+# A pool can be given to use instead of starting one, so callers with several lots of series
+# only start the workers once.
+def normalise_chunks(series: pd.Series, workers: int = 1, chunk_size: int = CHUNK_SIZE, pool = None):
+    starts = range(0, len(series.index), chunk_size)
+    chunks = (series.iloc[start:start+chunk_size].tolist() for start in starts)
+    if workers <= 1:
+        yield from zip(starts, map(normalise_month_data, chunks))
+        return
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=worker_context()) as pool:
+            yield from normalise_chunks(series, workers, chunk_size, pool)
+        return
+    in_flight = deque()
+    for start, chunk in zip(starts, chunks):
+        in_flight.append((start, pool.submit(normalise_month_data, chunk)))
+        if len(in_flight) >= workers * 2:
+            done, future = in_flight.popleft()
+            yield done, future.result()
+    while in_flight:
+        done, future = in_flight.popleft()
+        yield done, future.result()
 
-df["time_series"] = df["time_series"].apply(normalise_month_data)
-df["review_start"] = df["review_start"].apply(normalise_review_start_data)
 
-df.to_csv("normalised_data.csv", index=False)
+# Normalises the time series and writes them as a (games, months, 2) array of up and down
+# counts, with the rows in the same order as normalised_data.csv and the months in
+# normalised_months.npy. analysis.py memory maps these instead of parsing a string for
+# every game. Chunks are written as they come back so the output is never all in memory.
+# Progress is recorded on metrics if given.
+def save_series(series: pd.Series, workers: int = 1, chunk_size: int = CHUNK_SIZE, metrics = None):
+    matrix = np.lib.format.open_memmap("normalised_series.npy", mode="w+", dtype=np.int32,
+                                       shape=(len(series.index), len(MONTHS), 2))
+    for start, counts in normalise_chunks(series, workers, chunk_size):
+        matrix[start:start+len(counts)] = counts
+        if metrics:
+            metrics.rows(len(counts))
+            metrics.report()
+    matrix.flush()
+    np.save("normalised_months.npy", MONTH_ARRAY)
+
+# Normalises the histograms in the store a chunk at a time and writes the monthly series
+# back to it. The review starts are moved to their month when they are read instead. The
+# workers are started once and given a part of every chunk.
+def save_series_db(store, workers: int = 1, chunk_size: int = CHUNK_SIZE, metrics = None):
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=worker_context()) if workers > 1 else None
+    try:
+        for chunk in store.read_histograms(chunk_size):
+            part_size = -(-len(chunk.index) // max(workers, 1))
+            for start, counts in normalise_chunks(chunk["time_series"], workers, part_size, pool):
+                store.write_series(chunk["appid"].iloc[start:start+len(counts)], counts)
+                if metrics:
+                    metrics.rows(len(counts))
+                    metrics.report()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=1,
+                        help="Number of processes to normalise the data with")
+    parser.add_argument("-c", "--chunk-size", action="store", dest="chunk_size", type=int,
+                        default=CHUNK_SIZE, help="Number of games to give a process at once")
+    parser.add_argument("--metrics", action="store", dest="metrics", default="",
+                        help="File to write metrics to, as JSON lines or a Prometheus text file if it ends in .prom")
+    parser.add_argument("--profile", action="store_true", dest="profile",
+                        help="Profile the run with cProfile and tracemalloc and write the results to profiles/")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Normalise the histograms in this SQLite database from store.py instead of time_data.json")
+    args = parser.parse_args()
+
+    metrics = Metrics("normaliser", args.metrics)
+    if args.db:
+        from store import Store
+        with profiled("data-normaliser", args.profile), Store(args.db) as store:
+            metrics.total = store.conn.execute("SELECT count(*) FROM histograms").fetchone()[0]
+            with metrics.timer("normalise"):
+                save_series_db(store, args.workers, args.chunk_size, metrics)
+    else:
+        with profiled("data-normaliser", args.profile):
+            with metrics.timer("read"):
+                df = pd.read_json("time_data.json")
+            metrics.total = len(df.index)
+            with metrics.timer("normalise"):
+                df["review_start"] = normalise_review_start_data(df["review_start"].to_numpy(dtype=np.int64))
+                save_series(df["time_series"], args.workers, args.chunk_size, metrics)
+            with metrics.timer("write"):
+                df.drop(columns="time_series").to_csv("normalised_data.csv", index=False)
+    metrics.report(force=True)
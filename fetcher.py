@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+# Set STEAM_STORE_URL or STEAM_API_URL to point everything at a local server like mockserver.py.
+STORE_URL = os.environ.get("STEAM_STORE_URL", "https://store.steampowered.com")
+API_URL = os.environ.get("STEAM_API_URL", "https://api.steampowered.com")
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class TokenBucket:
+    '''
+    TokenBucket(rate: float, burst: int)
+
+    A thread safe token bucket used to keep the requests per second under the
+    given rate. Up to burst requests can be made at once before the rate applies.
+    A rate of 0 or less turns the limit off.
+    '''
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        '''
+        Blocks until a token is available and then uses it.
+        '''
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    '''
+    Fetcher(workers: int, rate: float, retries: int, backoff: float, timeout: float,
+            metrics: Metrics)
+
+    Makes requests to the steam APIs from a bounded pool of threads. Each thread
+    keeps its own keep-alive session, every request waits on a shared token bucket
+    and requests which get a 429, a 5xx or a response which isn't valid JSON back
+    are retried with exponential backoff. If metrics is given every request and
+    retry is recorded on it.
+    '''
+    def __init__(self, workers: int = 8, rate: float = 10, retries: int = 5,
+                 backoff: float = 1, timeout: float = 5, metrics = None):
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst=workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = metrics
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def session(self):
+        '''
+        Gets the session for the current thread, making it if needed.
+
+        Returns:
+        requests.Session
+        '''
+        if not hasattr(self.local, "session"):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.local.session = session
+        return self.local.session
+
+    def get_json(self, url: str, params=None):
+        '''
+        Requests the url and decodes the JSON response, retrying on rate limits,
+        server errors and responses which were cut off.
+
+        Returns:
+        The decoded JSON, or None if every attempt failed
+        '''
+        for attempt in range(self.retries + 1):
+            if attempt and self.metrics:
+                self.metrics.retry()
+            self.bucket.take()
+            start = time.perf_counter()
+            try:
+                req = self.session().get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.record(start, type(e).__name__)
+                print(f"Request to {url} failed: {e}")
+            else:
+                if req.status_code not in RETRY_STATUSES:
+                    if not req.ok:
+                        self.record(start, req.status_code)
+                        print(f"Request to {url} failed with status {req.status_code}")
+                        return None
+                    req.encoding = "utf-8"
+                    try:
+                        with self.metrics.timer("parse") if self.metrics else nullcontext():
+                            data = json.loads(req.text)
+                    except ValueError:
+                        self.record(start, "invalid_json")
+                        print(f"Request to {url} returned invalid JSON")
+                    else:
+                        self.record(start, req.status_code)
+                        return data
+                else:
+                    self.record(start, req.status_code)
+                    retry_after = req.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        time.sleep(int(retry_after))
+                        continue
+            time.sleep(self.backoff * 2 ** attempt)
+        print(f"Giving up on {url} after {self.retries + 1} attempts")
+        return None
+
+    def record(self, start: float, status):
+        '''
+        Records a request which started at start on the metrics, if there are any.
+        '''
+        if self.metrics:
+            self.metrics.request(time.perf_counter() - start, status)
+
+    def map(self, func, items, window: int = None, ordered: bool = True):
+        '''
+        Runs func(self, item) for every item on the thread pool. The results are
+        yielded as (item, result) in the same order as the items, with no more than
+        window requests in flight at once. If ordered is False they are yielded as
+        soon as they finish instead, so one slow item doesn't hold up the rest.
+        '''
+        window = window or self.workers * 4
+        if not ordered:
+            yield from self.map_unordered(func, items, window)
+            return
+        in_flight = deque()
+        for item in items:
+            in_flight.append((item, self.pool.submit(func, self, item)))
+            if len(in_flight) >= window:
+                done, future = in_flight.popleft()
+                yield done, future.result()
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield done, future.result()
+
+    def map_unordered(self, func, items, window: int):
+        '''
+        The same as map but yielding the results in the order they finish.
+        '''
+        in_flight = {}
+        for item in items:
+            in_flight[self.pool.submit(func, self, item)] = item
+            if len(in_flight) >= window:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield in_flight.pop(future), future.result()
+        for future in as_completed(list(in_flight)):
+            yield in_flight.pop(future), future.result()
+
+    def close(self):
+        '''
+        Shuts down the thread pool.
+        '''
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,70 @@
+import json
+import os
+
+class Journal:
+    '''
+    Journal(path: str)
+
+    An append only file of JSON lines, with one record per app that has been fetched.
+    Records are written in batches and synced to disk, so a crash can only lose the
+    batch being written. If an app appears more than once the last record wins, so
+    replaying the journal is idempotent.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.repair()
+
+    def repair(self):
+        '''
+        Cuts off a half written last line left behind by a crash.
+        '''
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def records(self):
+        '''
+        Replays the journal.
+
+        Returns:
+        dict of appid str to the last record written for that app
+        '''
+        result = {}
+        if not os.path.exists(self.path):
+            return result
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                result[str(record["appid"])] = record
+        return result
+
+    def append(self, records: list):
+        '''
+        Writes a batch of records to the end of the journal and syncs it to disk.
+        '''
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        '''
+        Removes the journal, used once the records are compacted into the final output.
+        '''
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Writes a file by writing a temporary file next to it then renaming it, so the
+# file is either the old version or the new one and never half written.
+def write_atomic(path: str, write):
+    temp_path = f"{path}.tmp"
+    write(temp_path)
+    with open(temp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
@@ -0,0 +1,204 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from journal import write_atomic
+
+# Upper bounds in seconds of the request latency histogram buckets, the last one catches everything.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+PROFILE_DIR = "profiles"
+
+class Metrics:
+    '''
+    Metrics(stage: str, path: str, total: int, interval: float)
+
+    Keeps count of the requests, rows and time spent in each part of a stage, and
+    every interval seconds prints the progress and writes a snapshot to path. If the
+    path ends in .prom it is rewritten as a Prometheus text file each time, otherwise
+    a JSON line is added to it. With no path it only prints. Thread safe, so the
+    fetcher's threads can record requests on it.
+    '''
+    def __init__(self, stage: str, path: str = "", total: int = 0, interval: float = 10):
+        self.stage = stage
+        self.path = path
+        self.total = total
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.done = 0
+        self.statuses = Counter()
+        self.retries = 0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.timings = Counter()
+        self.lock = threading.Lock()
+
+    def request(self, seconds: float, status):
+        '''
+        Records a request which took seconds and got the status back, either the
+        HTTP status code or the name of what went wrong.
+        '''
+        with self.lock:
+            self.statuses[str(status)] += 1
+            self.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+
+    def retry(self):
+        '''
+        Records a request being retried.
+        '''
+        with self.lock:
+            self.retries += 1
+
+    def rows(self, count: int = 1):
+        '''
+        Records count more rows being processed.
+        '''
+        with self.lock:
+            self.done += count
+
+    @contextmanager
+    def timer(self, part: str):
+        '''
+        Adds the time spent in the with block to the total for that part of the stage.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.timings[part] += time.perf_counter() - start
+
+    def timed(self, items, part: str):
+        '''
+        Yields the items, adding the time spent waiting for each one to the total for
+        that part of the stage. Used for the time spent waiting on the fetcher.
+        '''
+        items = iter(items)
+        while True:
+            with self.timer(part):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def snapshot(self):
+        '''
+        Works out the current rates and totals.
+
+        Returns:
+        dict of the metrics
+        '''
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+            requests = sum(self.statuses.values())
+            rate = self.done / elapsed if elapsed else 0
+            remaining = max(self.total - self.done, 0)
+            return {
+                "stage": self.stage,
+                "time": int(time.time()),
+                "elapsed_seconds": round(elapsed, 3),
+                "rows": self.done,
+                "total_rows": self.total,
+                "rows_per_second": round(rate, 3),
+                "eta_seconds": round(remaining / rate, 1) if rate else None,
+                "requests": requests,
+                "requests_per_second": round(requests / elapsed, 3) if elapsed else 0,
+                "statuses": dict(self.statuses),
+                "retries": self.retries,
+                "latency_buckets": dict(zip((str(x) for x in LATENCY_BUCKETS), self.latency)),
+                "latency_sum": round(self.latency_sum, 3),
+                "timings": {part: round(seconds, 3) for part, seconds in self.timings.items()}
+            }
+
+    def report(self, force: bool = False):
+        '''
+        Prints the progress and writes a snapshot if it has been interval seconds
+        since the last one, or straight away if force is True.
+        '''
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        snapshot = self.snapshot()
+        eta = snapshot["eta_seconds"]
+        requests = f"{snapshot['requests_per_second']} requests/s, {snapshot['retries']} retries, " \
+            if snapshot["requests"] else ""
+        print(f"{self.stage}: {snapshot['rows']}/{snapshot['total_rows']} rows, {requests}"
+              f"ETA {'unknown' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))}")
+        if not self.path:
+            return
+        if self.path.endswith(".prom"):
+            write_atomic(self.path, lambda path: write_text(path, prometheus_text(snapshot)))
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot) + "\n")
+
+
+# Writes text to a file, for write_atomic.
+def write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+# Formats a snapshot in the Prometheus text format, for the node exporter's textfile collector.
+def prometheus_text(snapshot: dict):
+    stage = f'stage="{snapshot["stage"]}"'
+    lines = [
+        "# TYPE steam_rows_processed_total counter",
+        f"steam_rows_processed_total{{{stage}}} {snapshot['rows']}",
+        "# TYPE steam_rows gauge",
+        f"steam_rows{{{stage}}} {snapshot['total_rows']}",
+        "# TYPE steam_eta_seconds gauge",
+        f"steam_eta_seconds{{{stage}}} {snapshot['eta_seconds'] if snapshot['eta_seconds'] is not None else 'NaN'}",
+        "# TYPE steam_requests_total counter",
+    ]
+    lines += [f'steam_requests_total{{{stage},status="{status}"}} {count}'
+              for status, count in sorted(snapshot["statuses"].items())]
+    lines += ["# TYPE steam_retries_total counter", f"steam_retries_total{{{stage}}} {snapshot['retries']}",
+              "# TYPE steam_request_seconds histogram"]
+    cumulative = 0
+    for bound, count in snapshot["latency_buckets"].items():
+        cumulative += count
+        lines.append(f'steam_request_seconds_bucket{{{stage},le="{"+Inf" if bound == "inf" else bound}"}} {cumulative}')
+    lines += [f"steam_request_seconds_sum{{{stage}}} {snapshot['latency_sum']}",
+              f"steam_request_seconds_count{{{stage}}} {snapshot['requests']}",
+              "# TYPE steam_stage_seconds_total counter"]
+    lines += [f'steam_stage_seconds_total{{{stage},part="{part}"}} {seconds}'
+              for part, seconds in sorted(snapshot["timings"].items())]
+    return "\n".join(lines) + "\n"
+
+# Runs the with block under cProfile and tracemalloc if enabled, then writes the profile to
+# profiles/{name}.prof for snakeviz or pstats and a summary of where the time and memory
+# went to profiles/{name}.txt.
+@contextmanager
+def profiled(name: str, enabled: bool = True, out_dir: str = PROFILE_DIR):
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        memory = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.makedirs(out_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(out_dir, f"{name}.prof"))
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(30)
+        report.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n\nTop allocations:\n")
+        for stat in memory.statistics("lineno")[:20]:
+            report.write(f"{stat}\n")
+        write_text(os.path.join(out_dir, f"{name}.txt"), report.getvalue())
+        print(f"Wrote the profile of {name} to {out_dir}")
@@ -0,0 +1,276 @@
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+from fetcher import Fetcher
+from synthetic import (FIRST_REVIEW, PAGE_SIZE, app_list_page, make_catalogue, review_histogram, review_page,
+                       review_summary)
+
+class Faults:
+    '''
+    Faults(latency: float, jitter: float, rate_limit: float, server_error: float,
+           truncate: float, fail: float, seed: int)
+
+    The problems to inject into the responses. latency and jitter are in seconds,
+    the rest are the fraction of requests which get a 429, a 503, JSON cut off part
+    way through, or a {"success": 0} payload.
+    '''
+    def __init__(self, latency: float = 0, jitter: float = 0, rate_limit: float = 0,
+                 server_error: float = 0, truncate: float = 0, fail: float = 0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chances = [("rate_limit", rate_limit), ("server_error", server_error),
+                        ("truncate", truncate), ("fail", fail)]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self):
+        '''
+        Works out how long to wait before responding.
+
+        Returns:
+        float of the delay in seconds
+        '''
+        with self.lock:
+            return max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+
+    def pick(self):
+        '''
+        Picks the fault for a request, if there is one.
+
+        Returns:
+        The name of the fault, or "ok"
+        '''
+        with self.lock:
+            roll = self.random.random()
+        for name, chance in self.chances:
+            if roll < chance:
+                return name
+            roll -= chance
+        return "ok"
+
+
+class MockSteam:
+    '''
+    MockSteam(catalogue: pd.DataFrame, histograms: dict, faults: Faults, seed: int)
+
+    The data the mock server responds with. catalogue has the columns of data.csv plus
+    review_start, histograms maps appids to recorded rollups. Apps without a recorded
+    histogram get a synthetic one, and the individual reviews are always synthetic.
+    Also counts the responses it has given.
+    '''
+    def __init__(self, catalogue: pd.DataFrame, histograms: dict = None, faults: Faults = None, seed: int = 0):
+        catalogue = catalogue.sort_values("appid").reset_index(drop=True)
+        self.games = catalogue.loc[catalogue["type"] != "DLC"].reset_index(drop=True)
+        self.dlc = catalogue.loc[catalogue["type"] == "DLC"].reset_index(drop=True)
+        self.apps = catalogue.set_index("appid", drop=False).to_dict("index")
+        self.histograms = histograms or {}
+        self.faults = faults or Faults()
+        self.seed = seed
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name: str):
+        '''
+        Adds one to the count of responses of the given kind.
+        '''
+        with self.lock:
+            self.stats[name] += 1
+
+    def app_list(self, query: dict):
+        '''
+        Makes an IStoreService/GetAppList response, filtered and paged the same way
+        as the real one.
+
+        Returns:
+        dict of the response
+        '''
+        apps = []
+        if query.get("include_games", "true").lower() != "false":
+            apps.append(self.games)
+        if query.get("include_dlc", "false").lower() == "true":
+            apps.append(self.dlc)
+        apps = pd.concat(apps).sort_values("appid") if apps else self.games.iloc[:0]
+        if "if_modified_since" in query:
+            apps = apps.loc[apps["last_modified"] > int(query["if_modified_since"])]
+        if "last_appid" in query:
+            apps = apps.loc[apps["appid"] > int(query["last_appid"])]
+        size = int(query.get("max_results", PAGE_SIZE))
+        return app_list_page(apps.iloc[:size], len(apps.index) > size)
+
+    def respond(self, path: str, query: dict):
+        '''
+        Makes the response for a request, without any faults.
+
+        Returns:
+        (status code, dict of the response)
+        '''
+        if path.rstrip("/") == "/IStoreService/GetAppList/v1":
+            return 200, self.app_list(query)
+        if path == "/stats":
+            with self.lock:
+                return 200, dict(self.stats)
+        match = re.fullmatch(r"/(appreviews|appreviewhistogram)/(\d+)", path)
+        if not match or int(match.group(2)) not in self.apps:
+            return 404, {"success": 0}
+        app = self.apps[int(match.group(2))]
+        if match.group(1) == "appreviews" and int(query.get("num_per_page", "0")) > 0:
+            return 200, review_page(app, query.get("cursor", "*"), int(query["num_per_page"]), self.seed)
+        if match.group(1) == "appreviews":
+            return 200, review_summary(app)
+        if app["appid"] in self.histograms:
+            start, rollups = self.histograms[app["appid"]]
+            return 200, {"success": 1, "results": {"start_date": start, "rollups": rollups,
+                                                  "rollup_type": "month", "weeks": []}}
+        return 200, review_histogram(app, self.seed)
+
+
+# Makes the request handler for a MockSteam. Each request waits for the injected latency,
+# then maybe gets one of the faults instead of its proper response.
+def make_handler(mock: MockSteam):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # So the fetcher's sessions can keep the connection open
+
+        def send(self, status: int, body: bytes, headers: dict = None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path != "/stats":
+                time.sleep(mock.faults.delay())
+                fault = mock.faults.pick()
+                mock.count(fault)
+                if fault == "rate_limit":
+                    self.send(429, b"", {"Retry-After": "1"})
+                    return
+                if fault == "server_error":
+                    self.send(503, b"")
+                    return
+                if fault == "fail" and "GetAppList" not in url.path:
+                    self.send(200, b'{"success":0}')
+                    return
+            status, data = mock.respond(url.path, query)
+            body = json.dumps(data).encode("utf-8")
+            if url.path != "/stats" and fault == "truncate":
+                body = body[:len(body) // 2]
+            self.send(status, body)
+
+        def log_message(self, format, *args):
+            pass # Thousands of requests a second would drown the terminal
+
+    return Handler
+
+# Loads a catalogue recorded by a real run of the scrapers from a folder with data.csv and
+# optionally time_data.json in it, returning the catalogue and the recorded histograms.
+def load_recorded(folder: str):
+    df = pd.read_csv(os.path.join(folder, "data.csv"))
+    df = df.loc[df["review_desc"] != "Unknown"] if "review_desc" in df.columns else df
+    df["appid"] = df["appid"].astype("int64")
+    if "type" not in df.columns:
+        df["type"] = "Game"
+    histograms = {}
+    time_path = os.path.join(folder, "time_data.json")
+    if os.path.exists(time_path):
+        time_df = pd.read_json(time_path)
+        time_df = time_df.loc[time_df["time_series"] != "Unknown"]
+        histograms = {int(appid): (int(start), series) for appid, start, series
+                      in zip(time_df["appid"], time_df["review_start"], time_df["time_series"])}
+    starts = {appid: start for appid, (start, _) in histograms.items()}
+    df["review_start"] = [starts.get(appid, FIRST_REVIEW) for appid in df["appid"]]
+    return df, histograms
+
+# Starts the mock server on a background thread and returns it, the base URL is
+# f"http://127.0.0.1:{server.server_port}". Port 0 picks a free port.
+def start_server(mock: MockSteam, port: int = 0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Fetches the review summary for every appid from the server the same way review-getter.py
+# does, and reports how fast it went and how many apps it got.
+def load_test(base_url: str, appids: list, workers: int, rate: float, backoff: float):
+    def get_summary(fetcher, appid):
+        data = fetcher.get_json(f"{base_url}/appreviews/{appid}?json=1", params={"num_per_page": "0"})
+        return data.get("query_summary") if data and data.get("success") == 1 else None
+
+    got = 0
+    start = time.perf_counter()
+    with Fetcher(workers=workers, rate=rate, backoff=backoff) as fetcher:
+        for _, data in fetcher.map(get_summary, appids):
+            got += data is not None
+    seconds = time.perf_counter() - start
+    print(f"Got {got} of {len(appids)} apps in {seconds:.2f}s, {len(appids) / seconds:.1f} apps/s")
+    return got, seconds
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-a", "--apps", action="store", dest="apps", type=int, default=10000,
+                        help="Number of apps in the synthetic catalogue")
+    parser.add_argument("-c", "--catalogue", action="store", dest="catalogue", default="",
+                        help="Folder with a data.csv and time_data.json to serve instead of a synthetic catalogue")
+    parser.add_argument("-s", "--seed", action="store", dest="seed", type=int, default=0,
+                        help="Seed for the synthetic catalogue and the faults")
+    parser.add_argument("-p", "--port", action="store", dest="port", type=int, default=8080,
+                        help="Port to listen on")
+    parser.add_argument("--latency", action="store", dest="latency", type=float, default=0,
+                        help="Milliseconds to wait before each response")
+    parser.add_argument("--jitter", action="store", dest="jitter", type=float, default=0,
+                        help="Milliseconds the latency varies by either way")
+    parser.add_argument("--rate-limit", action="store", dest="rate_limit", type=float, default=0,
+                        help="Fraction of requests to respond to with a 429")
+    parser.add_argument("--server-errors", action="store", dest="server_errors", type=float, default=0,
+                        help="Fraction of requests to respond to with a 503")
+    parser.add_argument("--truncate", action="store", dest="truncate", type=float, default=0,
+                        help="Fraction of responses to cut off half way through")
+    parser.add_argument("--fail", action="store", dest="fail", type=float, default=0,
+                        help="Fraction of store requests to respond to with success 0")
+    parser.add_argument("--load-test", action="store", dest="load_test", type=int, default=0,
+                        help="Instead of serving until stopped, fetch this many review summaries and report the speed")
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=8,
+                        help="With --load-test, number of requests to have in flight at once")
+    parser.add_argument("-r", "--rate", action="store", dest="rate", type=float, default=0,
+                        help="With --load-test, maximum requests per second, 0 for no limit")
+    parser.add_argument("--backoff", action="store", dest="backoff", type=float, default=0.1,
+                        help="With --load-test, seconds to back off for after the first failure")
+    args = parser.parse_args()
+
+    if args.catalogue:
+        catalogue, histograms = load_recorded(args.catalogue)
+    else:
+        catalogue, histograms = make_catalogue(args.apps, args.seed), {}
+    faults = Faults(args.latency / 1000, args.jitter / 1000, args.rate_limit, args.server_errors,
+                    args.truncate, args.fail, args.seed)
+    mock = MockSteam(catalogue, histograms, faults, args.seed)
+
+    if args.load_test:
+        server = start_server(mock, 0)
+        appids = catalogue["appid"].sample(min(args.load_test, len(catalogue.index)), random_state=args.seed)
+        load_test(f"http://127.0.0.1:{server.server_port}", appids.tolist(), args.workers, args.rate, args.backoff)
+        print(dict(mock.stats))
+        server.shutdown()
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(mock))
+        server.daemon_threads = True
+        print(f"Serving {len(catalogue.index)} apps on http://127.0.0.1:{args.port}, set STEAM_API_URL "
+              "and STEAM_STORE_URL to this to use it")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        print(dict(mock.stats))
@@ -0,0 +1,111 @@
+import numpy as np
+
+class MonthGrid:
+    '''
+    MonthGrid(counts: np.ndarray, months: np.ndarray, release: np.ndarray)
+
+    The up and down counts of a set of games on the shared month grid, as a
+    (games, months, 2) array, with release being the index of each game's first
+    month. The running totals along the months are worked out once, so the
+    reviews in any range of months are two lookups per game however long the
+    range is, and rolling windows, cumulative curves and cohorts are all
+    whole-array operations.
+    '''
+    def __init__(self, counts: np.ndarray, months: np.ndarray, release: np.ndarray = None):
+        self.months = months
+        games = len(counts)
+        self.release = np.zeros(games, dtype=np.int64) if release is None else np.asarray(release, dtype=np.int64)
+        # Running totals with a row of zeros in front, so months start to end-1 are cum[end] - cum[start].
+        # int32 is plenty for one game, the most reviews any game has is about 9 million.
+        dtype = np.result_type(np.asarray(counts).dtype, np.int32)
+        self.cum = np.zeros((games, len(months) + 1, 2), dtype=dtype)
+        np.cumsum(counts, axis=1, dtype=dtype, out=self.cum[:, 1:])
+
+    def __len__(self):
+        return len(self.cum)
+
+    def window(self, start, end):
+        '''
+        Counts each game's reviews in months start to end-1, where start and end are
+        month indexes, either one for every game or arrays with one for each.
+
+        Returns:
+        (games, 2) np.ndarray of up and down counts
+        '''
+        games = np.arange(len(self))
+        start = np.clip(np.broadcast_to(start, games.shape), 0, len(self.months))
+        end = np.clip(np.broadcast_to(end, games.shape), start, len(self.months))
+        return self.cum[games, end] - self.cum[games, start]
+
+    def rolling(self, n: int):
+        '''
+        Counts each game's reviews in the n months up to and including each month,
+        or fewer for the first n-1 months.
+
+        Returns:
+        (games, months, 2) np.ndarray
+        '''
+        ends = np.arange(1, len(self.months) + 1)
+        return self.cum[:, ends] - self.cum[:, np.maximum(ends - n, 0)]
+
+    def cumulative(self):
+        '''
+        Counts each game's reviews up to and including each month.
+
+        Returns:
+        (games, months, 2) np.ndarray
+        '''
+        return self.cum[:, 1:]
+
+    def total(self):
+        '''
+        Adds all the games together into one.
+
+        Returns:
+        MonthGrid of one game
+        '''
+        counts = np.diff(self.cum.sum(axis=0, dtype=np.int64), axis=0)
+        return MonthGrid(counts[None], self.months)
+
+    def ages(self, max_age: int):
+        '''
+        Lines the games up by months since release, from 0 to max_age. Months after
+        the end of the grid count as 0 and aren't observed.
+
+        Returns:
+        (games, max_age+1, 2) np.ndarray of counts, and a (games, max_age+1) bool
+        np.ndarray of which months have been observed
+        '''
+        slots = self.release[:, None] + np.arange(max_age + 1)[None, :]
+        observed = slots < len(self.months)
+        slots = np.minimum(slots, len(self.months) - 1)
+        games = np.arange(len(self))[:, None]
+        counts = self.cum[games, slots + 1] - self.cum[games, slots]
+        counts[~observed] = 0
+        return counts, observed
+
+    def cohorts(self, max_age: int, groups: np.ndarray = None):
+        '''
+        Adds up the games released in each month, or in each group of months if
+        groups gives the group of every month, by months since release.
+
+        Returns:
+        (cohorts, max_age+1, 2) np.ndarray of counts, and a (cohorts, max_age+1)
+        np.ndarray of the number of games observed at each age
+        '''
+        cohort = self.release if groups is None else np.asarray(groups)[self.release]
+        n_cohorts = len(self.months) if groups is None else int(np.max(groups)) + 1
+        counts, observed = self.ages(max_age)
+        totals = np.zeros((n_cohorts, max_age + 1, 2), dtype=np.int64)
+        games = np.zeros((n_cohorts, max_age + 1), dtype=np.int64)
+        np.add.at(totals, cohort, counts)
+        np.add.at(games, cohort, observed)
+        return totals, games
+
+
+# The review score of some (..., 2) up and down counts as a percentage, nan where there are
+# no reviews.
+def scores(counts: np.ndarray):
+    total = counts.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, counts[..., 0] / total * 100, np.nan)
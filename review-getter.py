@@ -1,31 +1,33 @@
-import json
-import requests
+from argparse import ArgumentParser
+from functools import partial
+import time
 import pandas as pd
+from fetcher import Fetcher, STORE_URL
+from journal import Journal, write_atomic
+from metrics import Metrics
+from workqueue import merge_records, pending_rows, stale_rows
 
-df = pd.read_csv("data.csv")
+REVIEW_COLUMNS = ["total_reviews", "positive_reviews", "negative_reviews", "review_desc", "review_score",
+                  "reviews_fetched"]
 
-# Add new columns to the database if we don't have them.
-if "total_reviews" not in df.columns.to_list():
-    review_columns = ["total_reviews", "positive_reviews", "negative_reviews", "review_desc", "review_score"]
-    df = df.reindex(df.columns.to_list() + review_columns, axis=1)
+# Reads data.csv, adding the review columns if we don't have them and filling them in
+# for any apps which csvmaker.py --merge has added since the last run.
+def load_data():
+    df = pd.read_csv("data.csv")
+    df = df.reindex(df.columns.to_list() + [x for x in REVIEW_COLUMNS if x not in df.columns], axis=1)
     df["review_desc"] = df["review_desc"].fillna("Unknown")
-    df = df.fillna(0)
-    df = df.astype(dtype={
+    df = df.fillna({x: 0 for x in REVIEW_COLUMNS if x != "review_desc"})
+    return df.astype(dtype={
         "appid":"str",
         "name":"str",
         "total_reviews": "int",
         "positive_reviews": "int",
         "negative_reviews": "int",
         "review_desc": "str",
-        "review_score": "int"
+        "review_score": "int",
+        "reviews_fetched": "int"
     })
 
-try:
-    with open("lastidx.txt", "r", encoding="utf-8-sig") as f:
-        last_id = int(f.read().strip())
-except FileNotFoundError:
-    last_id = 0
-
 params = { # The mixed types is intentional, Valve do it this way
     "language": "all",
     "purchase_type": "all",
@@ -33,42 +35,83 @@ params = { # The mixed types is intentional, Valve do it this way
     "filter_offtopic_activity": 0
 }
 
-# Go through the df line by line getting the review data.
-for i in df.index:
-    if "Unknown" not in df["review_desc"].tolist():
-        break
-    if i < last_id:
-        continue
-    appid = df.at[i,"appid"]
-    req = requests.get(f"https://store.steampowered.com/appreviews/{appid}?json=1", params=params, timeout=5)
-    req.encoding = "utf-8"
-    data = json.loads(req.text)["query_summary"]
-    df.iloc[i, 2:7] = {
-        "total_reviews": data["total_reviews"],
-        "positive_reviews": data["total_positive"], 
-        "negative_reviews": data["total_negative"],
-        "review_desc": data["review_score_desc"], 
-        "review_score": data["review_score"]
-    }
+# Get the review summary for one app, run on the fetcher's thread pool.
+def get_summary(fetcher, appid, store_url = STORE_URL):
+    data = fetcher.get_json(f"{store_url}/appreviews/{appid}?json=1", params=params)
+    return data.get("query_summary") if data and data.get("success") == 1 else None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=8,
+                        help="Number of requests to have in flight at once")
+    parser.add_argument("-r", "--rate", action="store", dest="rate", type=float, default=10,
+                        help="Maximum requests per second, 0 for no limit")
+    parser.add_argument("--store-url", action="store", dest="store_url", default=STORE_URL,
+                        help="Base URL of the steam store, change this to use a local server like mockserver.py")
+    parser.add_argument("-i", "--incremental", action="store_true", dest="incremental",
+                        help="Also refetch apps which have changed on steam since they were last fetched")
+    parser.add_argument("--max-age", action="store", dest="max_age", type=float, default=None,
+                        help="With --incremental, also refetch apps last fetched more than this many days ago")
+    parser.add_argument("--metrics", action="store", dest="metrics", default="",
+                        help="File to write metrics to every 10 seconds, as JSON lines or a Prometheus text file if it ends in .prom")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Read the apps from and write the reviews to this SQLite database from store.py "
+                             "instead of data.csv")
+    args = parser.parse_args()
+    max_age = args.max_age * 86400 if args.max_age is not None else None
+
+    if args.db:
+        from store import Store
+        # Each batch is its own transaction in the database, so there's no need for a journal
+        store = Store(args.db)
+        pending = store.pending_reviews(args.incremental, max_age)
+        save = store.upsert_reviews
+    else:
+        df = load_data()
+        # Apps already in the journal were fetched by a run which didn't finish, so skip them.
+        journal = Journal("reviews.journal")
+        done = journal.records().keys()
+        pending = pending_rows(df["review_desc"])
+        if args.incremental:
+            pending = sorted(set(pending) | set(stale_rows(df, "reviews_fetched", max_age)))
+        pending = [df.at[i,"appid"] for i in pending if str(df.at[i,"appid"]) not in done]
+        save = journal.append
+    records = []
+    metrics = Metrics("reviews", args.metrics, total=len(pending))
+    fetcher = Fetcher(workers=args.workers, rate=args.rate, metrics=metrics)
 
-    if i % 200 == 0: # Save every 200 games
-        df.to_csv("data.csv", index=False)
-        with open("lastidx.txt", "w", encoding="utf-8-sig") as f:
-            f.write(str(i))
-        print(f"Reached index {i}")
+    # Go through the apps without review data, saving the results in batches.
+    for appid, data in metrics.timed(fetcher.map(partial(get_summary, store_url=args.store_url), pending), "fetch"):
+        metrics.rows()
+        metrics.report()
+        if data is None:
+            continue
+        records.append({
+            "appid": str(appid),
+            "total_reviews": data["total_reviews"],
+            "positive_reviews": data["total_positive"],
+            "negative_reviews": data["total_negative"],
+            "review_desc": data["review_score_desc"],
+            "review_score": data["review_score"],
+            "reviews_fetched": int(time.time())
+        })
 
-# Find the index which marks the change between DLC and games, add an
-# identifier in a new column.
-if "type" not in df.columns.to_list():
-    prev_id = 0
-    for i in df.index:
-        cur_id = int(df.at[i,"appid"])
-        if cur_id < prev_id:
-            change_idx = i
-            break
-        prev_id = cur_id
+        if len(records) == 200: # Save every 200 games
+            with metrics.timer("write"):
+                save(records)
+            records = []
 
-    df.loc[df.index < change_idx, "type"] = "DLC"
-    df.loc[df.index >= change_idx, "type"] = "Game"
+    with metrics.timer("write"):
+        save(records)
+    fetcher.close()
 
-df.to_csv("data.csv", index=False)
\ No newline at end of file
+    if args.db:
+        store.close()
+    else:
+        # Compact the journal into the df, it gets written out in one go at the end.
+        with metrics.timer("write"):
+            merge_records(df, journal.records(), REVIEW_COLUMNS)
+            write_atomic("data.csv", lambda path: df.to_csv(path, index=False))
+        journal.clear()
+    metrics.report(force=True)
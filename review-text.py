@@ -0,0 +1,113 @@
+from argparse import ArgumentParser
+from functools import partial
+import pandas as pd
+from fetcher import Fetcher, STORE_URL
+from metrics import Metrics
+from shards import REVIEW_DIR, SHARDS, ShardWriter
+
+params = { # The mixed types is intentional, Valve do it this way
+    "json": 1,
+    "filter": "recent", # The cursor only goes through every review when sorted by date
+    "language": "all",
+    "review_type": "all",
+    "purchase_type": "all",
+    "num_per_page": "100", # The most steam gives at once
+    "filter_offtopic_activity": 0
+}
+
+# Finds the apps to download the reviews of, from the review summaries review-getter.py got.
+def select_apps(min_reviews = 10, max_reviews = None, type_ = None, appids = None, db = ""):
+    if db:
+        from store import Store
+        with Store(db) as store:
+            df = store.read_apps(min_reviews, max_reviews, type_)
+    else:
+        df = pd.read_csv("data.csv")
+        df = df.loc[df["review_desc"] != "Unknown"]
+        df = df.loc[df["total_reviews"] >= min_reviews]
+        if max_reviews is not None:
+            df = df.loc[df["total_reviews"] < max_reviews]
+        if type_ is not None:
+            df = df.loc[df["type"] == type_]
+    if appids:
+        df = df.loc[df["appid"].isin(appids)]
+    return df["appid"].astype(int).tolist()
+
+# Walks the pages of one app's reviews with the cursor, starting from its checkpoint if
+# a run before got part way through. Run on the fetcher's thread pool, so several apps
+# are downloaded at once. Returns the number of reviews and whether it got to the end.
+def get_reviews(fetcher, appid, writer: ShardWriter, checkpoints: dict, store_url = STORE_URL, language = "all",
+                max_per_app = None):
+    checkpoint = checkpoints.get(str(appid), {})
+    cursor = checkpoint.get("cursor", "*")
+    count = checkpoint.get("count", 0)
+    while True:
+        data = fetcher.get_json(f"{store_url}/appreviews/{appid}",
+                                params={**params, "language": language, "cursor": cursor})
+        if not data or data.get("success") != 1:
+            return count, False # Carry on from the checkpoint next time
+        reviews = data.get("reviews", [])
+        if max_per_app is not None:
+            reviews = reviews[:max(max_per_app - count, 0)]
+        next_cursor = data.get("cursor") or cursor
+        count += len(reviews)
+        done = not reviews or next_cursor == cursor or (max_per_app is not None and count >= max_per_app)
+        writer.write_page(appid, reviews, next_cursor, count, done)
+        if done:
+            return count, True
+        cursor = next_cursor
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=8,
+                        help="Number of apps to download at once")
+    parser.add_argument("-r", "--rate", action="store", dest="rate", type=float, default=10,
+                        help="Maximum requests per second, 0 for no limit")
+    parser.add_argument("--store-url", action="store", dest="store_url", default=STORE_URL,
+                        help="Base URL of the steam store, change this to use a local server like mockserver.py")
+    parser.add_argument("--min-reviews", action="store", dest="min_reviews", type=int, default=10,
+                        help="Only download the reviews of apps with at least this many")
+    parser.add_argument("--max-reviews", action="store", dest="max_reviews", type=int, default=None,
+                        help="Only download the reviews of apps with fewer than this many")
+    parser.add_argument("-t", "--type", action="store", dest="type", default=None, choices=["Game", "DLC"],
+                        help="Only download the reviews of this type of app")
+    parser.add_argument("-a", "--appids", action="store", dest="appids", nargs="+", type=int, default=None,
+                        help="Only download the reviews of these apps")
+    parser.add_argument("--max-per-app", action="store", dest="max_per_app", type=int, default=None,
+                        help="Stop after this many of an app's most recent reviews")
+    parser.add_argument("-l", "--language", action="store", dest="language", default="all",
+                        help="Only download reviews in this language, as steam names it, e.g. english")
+    parser.add_argument("-o", "--out", action="store", dest="out", default=REVIEW_DIR,
+                        help="Folder to write the review shards to")
+    parser.add_argument("-s", "--shards", action="store", dest="shards", type=int, default=SHARDS,
+                        help="Number of files to split the reviews between, keep it the same when resuming")
+    parser.add_argument("--metrics", action="store", dest="metrics", default="",
+                        help="File to write metrics to every 10 seconds, as JSON lines or a Prometheus text file if it ends in .prom")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Read the apps from this SQLite database from store.py instead of data.csv")
+    args = parser.parse_args()
+
+    writer = ShardWriter(args.out, args.shards)
+    checkpoints = writer.checkpoints()
+    pending = [x for x in select_apps(args.min_reviews, args.max_reviews, args.type, args.appids, args.db)
+               if not checkpoints.get(str(x), {}).get("done")]
+    metrics = Metrics("review-text", args.metrics, total=len(pending))
+    fetcher = Fetcher(workers=args.workers, rate=args.rate, metrics=metrics)
+    get_app = partial(get_reviews, writer=writer, checkpoints=checkpoints, store_url=args.store_url,
+                      language=args.language, max_per_app=args.max_per_app)
+    total = 0
+    unfinished = 0
+
+    # Apps are handled as they finish, so an app with millions of reviews doesn't hold up the rest.
+    for appid, (count, finished) in metrics.timed(fetcher.map(get_app, pending, ordered=False), "fetch"):
+        metrics.rows()
+        metrics.report()
+        total += count
+        unfinished += not finished
+
+    fetcher.close()
+    metrics.report(force=True)
+    print(f"Downloaded the reviews of {len(pending) - unfinished} apps, {total} reviews in all, to {args.out}")
+    if unfinished:
+        print(f"{unfinished} apps didn't finish, run again to carry on from where they stopped")
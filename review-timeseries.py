@@ -1,60 +1,158 @@
-import json
-import requests
+from argparse import ArgumentParser
+from functools import partial
+import time
 import pandas as pd
+from fetcher import Fetcher, STORE_URL
+from journal import Journal, write_atomic
+from metrics import Metrics
+import scheduler
+from workqueue import merge_records, pending_rows, stale_rows
 
-df = pd.read_csv("data.csv")
-
-# Add new columns to the database if we don't have them.
-if "time_series" not in df.columns.to_list():
-    time_columns = ["review_start", "time_series"]
-    df = df.reindex(df.columns.to_list() + time_columns, axis=1)
-    df["review_start"] = df["review_start"].fillna(0)
-    df["time_series"] = df["time_series"].fillna("Unknown")
-    df = df.astype(dtype={
-        "appid":"str",
-        "name":"str",
-        "total_reviews": "int",
-        "positive_reviews": "int",
-        "negative_reviews": "int",
-        "review_desc": "str",
-        "review_score": "int",
-        "type": "str",
-        "review_start": "int",
-        "time_series": "object"
-        })
+TIME_COLUMNS = ["review_start", "time_series", "histogram_fetched", "histogram_reviews"]
+
+# Reads the apps with at least 10 reviews from data.csv, along with the histograms we
+# already have from time_data.json. With merge the apps and their review summaries come from
+# data.csv even if time_data.json has them, for --incremental and --adaptive.
+def load_data(merge = False):
+    df = pd.read_csv("data.csv")
+
+    # Add new columns to the database if we don't have them.
+    if "time_series" not in df.columns.to_list():
+        df = df.reindex(df.columns.to_list() + TIME_COLUMNS, axis=1)
+        df["review_start"] = df["review_start"].fillna(0)
+        df["time_series"] = df["time_series"].fillna("Unknown")
+        df["histogram_fetched"] = df["histogram_fetched"].fillna(0)
+        df["histogram_reviews"] = df["histogram_reviews"].fillna(0)
+        df = df.astype(dtype={
+            "appid":"str",
+            "name":"str",
+            "total_reviews": "int",
+            "positive_reviews": "int",
+            "negative_reviews": "int",
+            "review_desc": "str",
+            "review_score": "int",
+            "type": "str",
+            "review_start": "int",
+            "time_series": "object",
+            "histogram_fetched": "int",
+            "histogram_reviews": "int"
+            })
 
-try:
-    relevant_df= pd.read_json("time_data.json")
-except FileNotFoundError:
-    relevant_df = df.loc[df["total_reviews"] >= 10]
-    relevant_df = relevant_df.reindex()
-
-try:
-    with open("timelastidx.txt", "r", encoding="utf-8-sig") as f:
-        last_id = int(f.read().strip())
-except FileNotFoundError:
-    last_id = 0
-
-# Go through the df line by line getting the review data.
-for i in relevant_df.index:
-    if "Unknown" not in relevant_df["time_series"].tolist():
-        break
-    if i < last_id:
-        continue
-    appid = relevant_df.at[i,"appid"]
-    req = requests.get(f"https://store.steampowered.com/appreviewhistogram/{appid}?l=all", timeout=5)
-    req.encoding = "utf-8"
-    data = json.loads(req.text)["results"]
-    relevant_df.at[i,"review_start"] = int(data["start_date"])
-    relevant_df.at[i,"time_series"] = data["rollups"]
-    
-    if i % 200 == 0: # Save every 200 games
-        relevant_df.to_json("time_data.json", index=False)
-        with open("timelastidx.txt", "w", encoding="utf-8-sig") as f:
-            f.write(str(i))
-        print(f"Reached index {i}")
-
-relevant_df.to_json("time_data.json", index=False)
+    try:
+        relevant_df= pd.read_json("time_data.json")
+        if merge:
+            # Take the apps and their review summaries from data.csv, keeping the histograms we
+            # already have. Apps new to data.csv get an empty histogram to be fetched.
+            old_df = relevant_df.reindex(["appid"] + TIME_COLUMNS, axis=1).astype({"appid": "str"})
+            relevant_df = df.loc[df["total_reviews"] >= 10].drop(columns=TIME_COLUMNS)
+            relevant_df = relevant_df.merge(old_df, on="appid", how="left")
+    except FileNotFoundError:
+        relevant_df = df.loc[df["total_reviews"] >= 10]
+        relevant_df = relevant_df.reindex()
 
+    relevant_df = relevant_df.reindex(relevant_df.columns.to_list()
+                                      + [x for x in TIME_COLUMNS if x not in relevant_df.columns], axis=1)
+    relevant_df = relevant_df.fillna({"review_start": 0, "time_series": "Unknown", "histogram_fetched": 0,
+                                      "histogram_reviews": 0})
+    return relevant_df.astype({"review_start": "int", "histogram_fetched": "int", "histogram_reviews": "int"})
+
+# Get the review histogram for one app, run on the fetcher's thread pool.
 # For some newer games the time series isn't in months, will have to transform the data to deal with that
-# In many games the time series skips over some months, I assume these are all zero, so will just fill them. 
\ No newline at end of file
+# In many games the time series skips over some months, I assume these are all zero, so will just fill them.
+def get_histogram(fetcher, appid, store_url = STORE_URL):
+    data = fetcher.get_json(f"{store_url}/appreviewhistogram/{appid}?l=all")
+    return data.get("results") if data and data.get("success") == 1 else None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=8,
+                        help="Number of requests to have in flight at once")
+    parser.add_argument("-r", "--rate", action="store", dest="rate", type=float, default=10,
+                        help="Maximum requests per second, 0 for no limit")
+    parser.add_argument("--store-url", action="store", dest="store_url", default=STORE_URL,
+                        help="Base URL of the steam store, change this to use a local server like mockserver.py")
+    parser.add_argument("-i", "--incremental", action="store_true", dest="incremental",
+                        help="Add new apps from data.csv and refetch apps which have changed on steam "
+                             "since their histogram was last fetched")
+    parser.add_argument("--max-age", action="store", dest="max_age", type=float, default=None,
+                        help="With --incremental, also refetch histograms more than this many days old")
+    parser.add_argument("-a", "--adaptive", action="store_true", dest="adaptive",
+                        help="Like --incremental, but only fetch the histograms which are due for their popularity "
+                             "tier or have gained reviews since they were fetched, most changed first")
+    parser.add_argument("-b", "--budget", action="store", dest="budget", type=int, default=None,
+                        help="With --adaptive, the most histograms to fetch this run")
+    parser.add_argument("--metrics", action="store", dest="metrics", default="",
+                        help="File to write metrics to every 10 seconds, as JSON lines or a Prometheus text file if it ends in .prom")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="Read the apps from and write the histograms to this SQLite database from store.py "
+                             "instead of data.csv and time_data.json")
+    args = parser.parse_args()
+    max_age = args.max_age * 86400 if args.max_age is not None else None
+
+    if args.db:
+        from store import Store
+        # Each batch is its own transaction in the database, so there's no need for a journal
+        store = Store(args.db)
+        schedule_df = store.histogram_schedule()
+        if args.adaptive:
+            pending = scheduler.schedule(schedule_df, args.budget)
+        else:
+            pending = store.pending_histograms(args.incremental, max_age)
+        save = store.upsert_histograms
+    else:
+        relevant_df = load_data(args.incremental or args.adaptive)
+        # Apps already in the journal were fetched by a run which didn't finish, so skip them.
+        journal = Journal("timeseries.journal")
+        done = journal.records().keys()
+        schedule_df = relevant_df.loc[~relevant_df["appid"].astype(str).isin(done)]
+        if args.adaptive:
+            pending = scheduler.schedule(schedule_df, args.budget)
+        else:
+            pending = pending_rows(relevant_df["time_series"])
+            if args.incremental:
+                pending = sorted(set(pending) | set(stale_rows(relevant_df, "histogram_fetched", max_age)))
+            pending = [relevant_df.at[i,"appid"] for i in pending if str(relevant_df.at[i,"appid"]) not in done]
+        save = journal.append
+    if args.adaptive:
+        for minimum, days, apps, due in scheduler.summary(schedule_df):
+            print(f"{apps} apps with {minimum}+ reviews, refetched every {days} days: {due} due")
+        print(f"Fetching {len(pending)} histograms")
+    # The review totals the histograms are fetched at, so the next run can tell which have changed.
+    totals = dict(zip(schedule_df["appid"].astype(str), schedule_df["total_reviews"]))
+    records = []
+    metrics = Metrics("timeseries", args.metrics, total=len(pending))
+    fetcher = Fetcher(workers=args.workers, rate=args.rate, metrics=metrics)
+
+    # Go through the apps without time series data, saving the results in batches.
+    for appid, data in metrics.timed(fetcher.map(partial(get_histogram, store_url=args.store_url), pending), "fetch"):
+        metrics.rows()
+        metrics.report()
+        if data is None:
+            continue
+        records.append({
+            "appid": str(appid),
+            "review_start": int(data["start_date"]),
+            "time_series": data["rollups"],
+            "histogram_fetched": int(time.time()),
+            "histogram_reviews": int(totals.get(str(appid), 0))
+        })
+
+        if len(records) == 200: # Save every 200 games
+            with metrics.timer("write"):
+                save(records)
+            records = []
+
+    with metrics.timer("write"):
+        save(records)
+    fetcher.close()
+
+    if args.db:
+        store.close()
+    else:
+        # Compact the journal into the df and write it out in one go.
+        with metrics.timer("write"):
+            merge_records(relevant_df, journal.records(), TIME_COLUMNS)
+            write_atomic("time_data.json", lambda path: relevant_df.to_json(path, index=False))
+        journal.clear()
+    metrics.report(force=True)
@@ -0,0 +1,69 @@
+import heapq
+import time
+import numpy as np
+import pandas as pd
+
+DAY = 86400
+# The popularity tiers, as the fewest reviews an app needs to be in the tier and how many
+# days until its histogram is due to be fetched again. Popular apps get new reviews every
+# day, the rest only now and then.
+TIERS = [(100000, 1), (10000, 3), (1000, 7), (100, 30), (10, 90)]
+# Apps whose first review was less than this long ago are fetched sooner, as their months
+# fill up quickly and the store sometimes gives them weekly rollups to begin with.
+NEW_RELEASE = 180 * DAY
+NEW_BOOST = 4
+# An app is due early if it has gained this fraction of the reviews it had when it was
+# last fetched.
+REFETCH_SHARE = 0.1
+# An app without any new reviews is still fetched after this many of its tier's intervals,
+# in case steam changed its history.
+MAX_SKIPS = 4
+
+# The tier of each app by its number of reviews, as an index into TIERS. Apps with fewer
+# reviews than the lowest tier get len(TIERS).
+def app_tiers(total_reviews):
+    minimums = np.array([x[0] for x in TIERS])
+    return (np.asarray(total_reviews)[:, None] < minimums[None, :]).sum(axis=1)
+
+# Works out how much each app's histogram needs fetching. df needs total_reviews,
+# review_start, histogram_fetched and histogram_reviews, the total_reviews when the
+# histogram was fetched, and may have last_modified. Apps which have never been fetched get
+# inf, and apps which aren't due get nan. For the rest the priority is the number of new
+# reviews times how many intervals overdue it is, boosted for new releases, so it goes
+# up the more the histogram has likely changed. Histograms fetched before histogram_reviews
+# was recorded have it as 0, so how many reviews they have gained isn't known, and they are
+# only due when their tier's time is up.
+def priorities(df: pd.DataFrame, now: float = None):
+    now = time.time() if now is None else now
+    tiers = app_tiers(df["total_reviews"].to_numpy())
+    intervals = np.array([x[1] for x in TIERS] + [np.inf]) * DAY
+    total = df["total_reviews"].to_numpy(dtype=np.float64)
+    known = df["histogram_reviews"].to_numpy(dtype=np.float64)
+    fetched = df["histogram_fetched"].to_numpy(dtype=np.float64)
+    overdue = (now - fetched) / intervals[tiers]
+    unknown = (known == 0) & (fetched > 0)
+    new = np.where(unknown, 0, np.maximum(total - known, 0))
+    changed = unknown | (total != known)
+    if "last_modified" in df.columns:
+        changed |= df["last_modified"].fillna(0).to_numpy() > fetched
+    due = (changed & (overdue >= 1)) | ((new >= REFETCH_SHARE * known) & (new > 0)) | (overdue >= MAX_SKIPS)
+    boost = np.where(now - df["review_start"].to_numpy(dtype=np.float64) < NEW_RELEASE, NEW_BOOST, 1)
+    priority = np.where(due, (new + 1) * overdue * boost, np.nan)
+    return np.where(tiers == len(TIERS), np.nan, np.where(fetched == 0, np.inf, priority))
+
+# Picks the apps to fetch the histograms of, most needed first, by putting the ones which
+# are due on a priority queue and taking up to budget of them, or all of them if it's None.
+# Returns the appids.
+def schedule(df: pd.DataFrame, budget: int = None, now: float = None):
+    queue = [(-priority, appid) for priority, appid in zip(priorities(df, now).tolist(), df["appid"].tolist())
+             if priority == priority] # nan isn't equal to itself
+    heapq.heapify(queue)
+    budget = len(queue) if budget is None else min(budget, len(queue))
+    return [heapq.heappop(queue)[1] for _ in range(budget)]
+
+# Counts the apps in each tier and how many of them are due, for printing.
+def summary(df: pd.DataFrame, now: float = None):
+    tiers = app_tiers(df["total_reviews"].to_numpy())
+    due = ~np.isnan(priorities(df, now))
+    return [(minimum, days, int((tiers == i).sum()), int((due & (tiers == i)).sum()))
+            for i, (minimum, days) in enumerate(TIERS)]
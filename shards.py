@@ -0,0 +1,132 @@
+import glob
+import gzip
+import json
+import os
+import threading
+import zlib
+from journal import Journal
+
+REVIEW_DIR = "reviews"
+SHARDS = 64
+
+# Flattens a review from the appreviews API into the record stored in the shards.
+def review_record(appid, review: dict):
+    author = review.get("author", {})
+    return {
+        "appid": int(appid),
+        "recommendationid": str(review["recommendationid"]),
+        "steamid": author.get("steamid"),
+        "num_games_owned": author.get("num_games_owned"),
+        "num_reviews": author.get("num_reviews"),
+        "playtime_forever": author.get("playtime_forever"),
+        "playtime_last_two_weeks": author.get("playtime_last_two_weeks"),
+        "playtime_at_review": author.get("playtime_at_review"),
+        "language": review.get("language"),
+        "review": review.get("review", ""),
+        "timestamp_created": review.get("timestamp_created"),
+        "timestamp_updated": review.get("timestamp_updated"),
+        "voted_up": review.get("voted_up"),
+        "votes_up": review.get("votes_up"),
+        "votes_funny": review.get("votes_funny"),
+        "weighted_vote_score": float(review.get("weighted_vote_score") or 0),
+        "comment_count": review.get("comment_count"),
+        "steam_purchase": review.get("steam_purchase"),
+        "received_for_free": review.get("received_for_free"),
+        "written_during_early_access": review.get("written_during_early_access")
+    }
+
+
+class ShardWriter:
+    '''
+    ShardWriter(folder: str, shards: int)
+
+    Appends reviews to gzipped JSON lines files, with each app's reviews going in
+    shard appid % shards so no file gets too big and an app is always in one place.
+    Every page is compressed into its own gzip member, which gzip reads back as one
+    stream, and then the app's cursor and the shard's size are checkpointed. When
+    it starts any shard longer than its last checkpoint is cut back, so a crash
+    can't leave half a page or a page which will be fetched again. Thread safe.
+    '''
+    def __init__(self, folder: str = REVIEW_DIR, shards: int = SHARDS):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.shards = shards
+        self.journal = Journal(os.path.join(folder, "checkpoints.journal"))
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.journal_lock = threading.Lock()
+        self.repair()
+
+    def shard_path(self, shard: int):
+        '''
+        Gets the path of a shard.
+
+        Returns:
+        str
+        '''
+        return os.path.join(self.folder, f"shard-{shard:03d}.jsonl.gz")
+
+    def checkpoints(self):
+        '''
+        Replays the checkpoints.
+
+        Returns:
+        dict of appid str to the last checkpoint for that app
+        '''
+        return self.journal.records()
+
+    def repair(self):
+        '''
+        Cuts each shard back to its size at the last checkpoint which wrote to it.
+        '''
+        sizes = {}
+        for checkpoint in self.checkpoints().values():
+            shard = checkpoint["shard"]
+            sizes[shard] = max(sizes.get(shard, 0), checkpoint["shard_size"])
+        for shard, size in sizes.items():
+            path = self.shard_path(shard)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "rb+") as f:
+                    f.truncate(size)
+
+    def write_page(self, appid, reviews: list, cursor: str, count: int, done: bool):
+        '''
+        Writes a page of an app's reviews to its shard, then checkpoints the cursor for
+        the next page, the number of reviews so far and whether the app is finished.
+        '''
+        shard = int(appid) % self.shards
+        data = gzip.compress("".join(json.dumps(review_record(appid, x)) + "\n" for x in reviews).encode("utf-8"))
+        with self.locks[shard]:
+            with open(self.shard_path(shard), "ab") as f:
+                if reviews:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                size = f.tell()
+            # Checkpoint inside the shard lock so the sizes are in the order they were written
+            with self.journal_lock:
+                self.journal.append([{"appid": str(appid), "cursor": cursor, "count": count, "done": done,
+                                      "shard": shard, "shard_size": size}])
+
+
+# Yields the reviews in one shard. A review written twice, which can only happen if the
+# checkpoints were deleted, is only yielded once.
+def read_shard(path: str):
+    seen = set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                review = json.loads(line)
+                if review["recommendationid"] not in seen:
+                    seen.add(review["recommendationid"])
+                    yield review
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            pass # A page cut off by a crash before the writer repaired it
+
+# Finds the shards in a folder.
+def find_shards(folder: str = REVIEW_DIR):
+    return sorted(glob.glob(os.path.join(folder, "shard-*.jsonl.gz")))
+
+# Yields every review in the shards in a folder, one shard at a time.
+def read_reviews(folder: str = REVIEW_DIR):
+    for path in find_shards(folder):
+        yield from read_shard(path)
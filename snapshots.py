@@ -0,0 +1,397 @@
+from argparse import ArgumentParser
+import datetime as dt
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from utils import MONTH_ARRAY, MONTHS, SeriesIndex
+
+SNAPSHOT_PATH = "snapshots.db"
+CHUNK_SIZE = 10000
+# The columns of data.csv which are compared between crawls. reviews_fetched is left out as
+# it changes every time.
+TRACKED_COLUMNS = ["name", "type", "last_modified", "price_change_number", "total_reviews", "positive_reviews",
+                   "negative_reviews", "review_desc", "review_score"]
+TEXT_COLUMNS = ["name", "type", "review_desc"]
+
+# Each version of an app or month is the value from that crawl on, until a later crawl has a
+# new version. An app missing from a crawl gets a version with removed = 1.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    crawl INTEGER PRIMARY KEY,
+    taken INTEGER NOT NULL,
+    apps INTEGER NOT NULL,
+    changed_apps INTEGER NOT NULL,
+    changed_months INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS app_versions (
+    appid INTEGER NOT NULL,
+    crawl INTEGER NOT NULL REFERENCES crawls(crawl),
+    removed INTEGER NOT NULL DEFAULT 0,
+    name TEXT,
+    type TEXT,
+    last_modified INTEGER,
+    price_change_number INTEGER,
+    total_reviews INTEGER,
+    positive_reviews INTEGER,
+    negative_reviews INTEGER,
+    review_desc TEXT,
+    review_score INTEGER,
+    PRIMARY KEY (appid, crawl)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_versions (
+    appid INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    crawl INTEGER NOT NULL REFERENCES crawls(crawl),
+    up INTEGER NOT NULL,
+    down INTEGER NOT NULL,
+    PRIMARY KEY (appid, month, crawl)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS app_versions_crawl ON app_versions(crawl);
+CREATE INDEX IF NOT EXISTS series_versions_crawl ON series_versions(crawl, appid);
+"""
+
+# Puts the tracked columns of some app data into the same types whether they came from a
+# csv or the database, so the same values compare as equal.
+def normalise_apps(df: pd.DataFrame):
+    df = df.reindex(columns=["appid"] + TRACKED_COLUMNS)
+    df = df.fillna({x: "" if x in TEXT_COLUMNS else 0 for x in TRACKED_COLUMNS})
+    df = df.astype({x: "str" if x in TEXT_COLUMNS else "int64" for x in TRACKED_COLUMNS} | {"appid": "int64"})
+    return df.set_index("appid").sort_index()
+
+# Turns a date like 2024-05-01 or a unix timestamp into a timestamp.
+def parse_date(date):
+    if isinstance(date, str) and not date.isdigit():
+        return int(dt.datetime.fromisoformat(date).replace(tzinfo=dt.UTC).timestamp())
+    return int(date)
+
+
+class SnapshotStore:
+    '''
+    SnapshotStore(path: str)
+
+    A history of crawls, each stored as the difference from the one before: the apps
+    whose review summary changed, and the months of their time series which changed
+    or are new. Any app or the whole catalogue can be rebuilt as it was at any crawl
+    from the versions up to it, and the changes between two crawls are read straight
+    from the versions in between, without rebuilding everything.
+    '''
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (appid INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS crawled (appid INTEGER PRIMARY KEY)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def crawls(self):
+        '''
+        Lists the crawls recorded.
+
+        Returns:
+        pd.DataFrame of crawl, taken, apps, changed_apps and changed_months
+        '''
+        return pd.read_sql_query("SELECT * FROM crawls ORDER BY crawl", self.conn)
+
+    def crawl_at(self, date = None):
+        '''
+        Finds the last crawl taken at or before a date, or the latest crawl if date is
+        None.
+
+        Returns:
+        int crawl, or 0 if there wasn't one
+        '''
+        if date is None:
+            row = self.conn.execute("SELECT MAX(crawl) FROM crawls").fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(crawl) FROM crawls WHERE taken <= ?", (parse_date(date),)).fetchone()
+        return row[0] or 0
+
+    def _want(self, appids):
+        # Fills the temporary table the queries join with to only read some apps.
+        self.conn.execute("DELETE FROM wanted")
+        if appids is not None:
+            self.conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((int(x),) for x in appids))
+        return "" if appids is None else "AND appid IN (SELECT appid FROM wanted)"
+
+    def apps(self, crawl: int, appids = None):
+        '''
+        Rebuilds the apps as they were at a crawl, from the last version of each up to
+        it. Only the apps in appids if it is given. Removed apps are left out.
+
+        Returns:
+        pd.DataFrame indexed by appid with the TRACKED_COLUMNS
+        '''
+        only = self._want(appids)
+        df = pd.read_sql_query(f"""
+            SELECT v.* FROM app_versions v JOIN (
+                SELECT appid, MAX(crawl) AS crawl FROM app_versions WHERE crawl <= :crawl {only} GROUP BY appid
+            ) latest USING (appid, crawl) WHERE v.removed = 0
+        """, self.conn, params={"crawl": crawl})
+        return normalise_apps(df)
+
+    def series(self, crawl: int, appids):
+        '''
+        Rebuilds the time series of the apps as they were at a crawl.
+
+        Returns:
+        (apps, months, 2) np.ndarray in the same order as appids, with the months being MONTHS
+        '''
+        appids = np.asarray(appids, dtype=np.int64)
+        result = np.zeros((len(appids), len(MONTHS), 2), dtype=np.int32)
+        only = self._want(appids.tolist())
+        rows = np.array(self.conn.execute(f"""
+            SELECT v.appid, v.month, v.up, v.down FROM series_versions v JOIN (
+                SELECT appid, month, MAX(crawl) AS crawl FROM series_versions
+                WHERE crawl <= :crawl {only} GROUP BY appid, month
+            ) latest USING (appid, month, crawl)
+        """, {"crawl": crawl}).fetchall(), dtype=np.int64).reshape(-1, 4)
+        if len(rows) and len(appids):
+            order = np.argsort(appids)
+            positions = order[np.searchsorted(appids, rows[:, 0], sorter=order)]
+            result[positions, np.searchsorted(MONTH_ARRAY, rows[:, 1])] = rows[:, 2:]
+        return result
+
+    def record(self, apps: pd.DataFrame, series_appids, index: SeriesIndex, taken: int = None):
+        '''
+        Records a crawl as the differences from the last one. apps is data.csv or the
+        same from the database, series_appids are the apps with time series and index
+        has their series in the same order. taken defaults to now, and has to be after
+        the last crawl. Each chunk of apps is compared with the last crawl rebuilt for
+        just that chunk, so the whole catalogue is never in memory twice.
+
+        Returns:
+        (number of changed apps, number of changed months)
+        '''
+        taken = int(time.time()) if taken is None else taken
+        last = self.crawl_at()
+        if last and taken <= self.conn.execute("SELECT taken FROM crawls WHERE crawl = ?", (last,)).fetchone()[0]:
+            raise ValueError("Crawls have to be recorded in the order they were taken")
+        crawl = last + 1
+        new = normalise_apps(apps)
+        changed_apps = changed_months = 0
+        with self.conn:
+            self.conn.execute("INSERT INTO crawls VALUES (?, ?, ?, 0, 0)", (crawl, taken, len(new.index)))
+            for start in range(0, len(new.index), CHUNK_SIZE):
+                chunk = new.iloc[start:start+CHUNK_SIZE]
+                old = self.apps(last, chunk.index.tolist()).reindex(chunk.index)
+                changed = chunk.loc[(chunk != old).any(axis=1)]
+                self.conn.executemany(f"INSERT INTO app_versions VALUES (?, ?, 0, {', '.join('?' * len(TRACKED_COLUMNS))})",
+                                      ((appid, crawl, *row) for appid, row in zip(changed.index.tolist(),
+                                                                                  changed.itertuples(index=False))))
+                changed_apps += len(changed.index)
+            # Apps in the last crawl but not this one are removed, found in the database by
+            # comparing their last versions with the apps in this crawl
+            self.conn.execute("DELETE FROM crawled")
+            self.conn.executemany("INSERT INTO crawled VALUES (?)", ((x,) for x in new.index.tolist()))
+            removed = self.conn.execute("""
+                INSERT INTO app_versions (appid, crawl, removed)
+                SELECT v.appid, :crawl, 1 FROM app_versions v JOIN (
+                    SELECT appid, MAX(crawl) AS crawl FROM app_versions WHERE crawl <= :last GROUP BY appid
+                ) latest USING (appid, crawl)
+                WHERE v.removed = 0 AND v.appid NOT IN (SELECT appid FROM crawled)
+            """, {"crawl": crawl, "last": last}).rowcount
+            changed_apps += removed
+
+            series_appids = np.asarray(series_appids, dtype=np.int64)
+            # The months may not line up with MONTHS if they were normalised in an earlier month
+            keep = np.isin(index.months, MONTH_ARRAY)
+            slots = np.searchsorted(MONTH_ARRAY, index.months[keep])
+            for start in range(0, len(series_appids), CHUNK_SIZE):
+                appids = series_appids[start:start+CHUNK_SIZE]
+                counts = np.zeros((len(appids), len(MONTHS), 2), dtype=np.int32)
+                counts[:, slots] = index.matrix(np.arange(start, start + len(appids)))[:, keep]
+                rows, months = np.nonzero((counts != self.series(last, appids)).any(axis=2))
+                self.conn.executemany("INSERT INTO series_versions VALUES (?, ?, ?, ?, ?)",
+                                      zip(appids[rows].tolist(), MONTH_ARRAY[months].tolist(), [crawl] * len(rows),
+                                          counts[rows, months, 0].tolist(), counts[rows, months, 1].tolist()))
+                changed_months += len(rows)
+            self.conn.execute("UPDATE crawls SET changed_apps = ?, changed_months = ? WHERE crawl = ?",
+                              (changed_apps, changed_months, crawl))
+        return changed_apps, changed_months
+
+    def changed_apps(self, before: int, after: int):
+        '''
+        Finds the apps with a new version after crawl before, up to and including after.
+
+        Returns:
+        list of appids
+        '''
+        return [x[0] for x in self.conn.execute(
+            "SELECT DISTINCT appid FROM app_versions WHERE crawl > ? AND crawl <= ? ORDER BY appid", (before, after))]
+
+    def compare(self, before: int, after: int):
+        '''
+        The apps which changed between two crawls, with their review counts and scores
+        at both. Apps which didn't exist at before, or were removed by after, are left out.
+
+        Returns:
+        pd.DataFrame indexed by appid
+        '''
+        appids = self.changed_apps(before, after)
+        old, new = self.apps(before, appids), self.apps(after, appids)
+        df = new[["name", "total_reviews", "positive_reviews", "negative_reviews"]].join(
+            old[["total_reviews", "positive_reviews", "negative_reviews"]], how="inner", rsuffix="_before")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df["score_before"] = df["positive_reviews_before"] / df["total_reviews_before"] * 100
+            df["score"] = df["positive_reviews"] / df["total_reviews"] * 100
+        df["new_positive"] = df["positive_reviews"] - df["positive_reviews_before"]
+        df["new_negative"] = df["negative_reviews"] - df["negative_reviews_before"]
+        return df
+
+    def swings(self, before: int, after: int, min_reviews: int = 100, n: int = 20):
+        '''
+        The apps whose review score moved the most between two crawls, out of the ones
+        with at least min_reviews reviews at both.
+
+        Returns:
+        pd.DataFrame of the n biggest swings either way
+        '''
+        df = self.compare(before, after)
+        df = df.loc[(df["total_reviews_before"] >= min_reviews) & (df["total_reviews"] >= min_reviews)]
+        df = df.assign(change=df["score"] - df["score_before"])
+        return df.reindex(df["change"].abs().sort_values(ascending=False).index)[
+            ["name", "total_reviews_before", "total_reviews", "score_before", "score", "change"]].head(n)
+
+    def bombs(self, before: int, after: int, min_new: int = 50, share: float = 0.5, n: int = 20):
+        '''
+        Finds review bombs between two crawls: apps with at least min_new new negative
+        reviews, where at least share of the new reviews were negative but less than
+        share of the ones before were. Each comes with the month which got the most new
+        negative reviews, from the months which changed.
+
+        Returns:
+        pd.DataFrame of the n apps with the most new negative reviews
+        '''
+        df = self.compare(before, after)
+        new_total = df["new_positive"] + df["new_negative"]
+        df = df.loc[(df["new_negative"] >= min_new) & (df["new_negative"] >= share * new_total)
+                    & (df["negative_reviews_before"] < share * df["total_reviews_before"])]
+        df = df.sort_values("new_negative", ascending=False).head(n)
+        df = df.assign(new_negative_share=df["new_negative"] / (df["new_positive"] + df["new_negative"]) * 100,
+                       worst_month=self.worst_months(before, after, df.index.tolist()))
+        return df[["name", "score_before", "score", "new_positive", "new_negative", "new_negative_share",
+                   "worst_month"]]
+
+    def worst_months(self, before: int, after: int, appids: list):
+        '''
+        For each app, the month whose negative review count grew the most between two
+        crawls, out of the months with a version in between.
+
+        Returns:
+        list of month timestamps, or None for apps without any changed months
+        '''
+        if not appids:
+            return []
+        old, new = self.series(before, appids), self.series(after, appids)
+        self._want(appids)
+        changed = np.zeros(old.shape[:2], dtype=bool)
+        positions = {appid: i for i, appid in enumerate(appids)}
+        for appid, month in self.conn.execute("""
+            SELECT DISTINCT appid, month FROM series_versions
+            WHERE crawl > ? AND crawl <= ? AND appid IN (SELECT appid FROM wanted)
+        """, (before, after)):
+            changed[positions[appid], np.searchsorted(MONTH_ARRAY, month)] = True
+        growth = np.where(changed, new[:, :, 1] - old[:, :, 1], np.iinfo(np.int32).min)
+        best = growth.argmax(axis=1)
+        return [int(MONTH_ARRAY[x]) if changed[i].any() else None for i, x in enumerate(best)]
+
+    def close(self):
+        self.conn.close()
+
+
+# Reads a crawl from data.csv and the normalised files in this folder, or from a database
+# from store.py. Returns the apps, the appids with time series and a SeriesIndex of them.
+def load_crawl(db: str = ""):
+    if db:
+        from store import Store
+        with Store(db) as store:
+            apps = store.read_apps()
+            appids = store.read_time_data()["appid"].to_numpy()
+        def load(positions):
+            with Store(db) as store:
+                return store.read_series(appids[positions])
+        return apps, appids, SeriesIndex(MONTH_ARRAY, load, keep=False)
+    apps = pd.read_csv("data.csv")
+    if not os.path.exists("normalised_series.npy"):
+        return apps, [], SeriesIndex(MONTH_ARRAY, None, keep=False)
+    appids = pd.read_csv("normalised_data.csv", usecols=["appid"])["appid"].to_numpy()
+    series = np.load("normalised_series.npy", mmap_mode="r")
+    return apps, appids, SeriesIndex(np.load("normalised_months.npy"), lambda positions: series[positions], keep=False)
+
+# Prints a date from a timestamp.
+def show_date(timestamp):
+    return dt.datetime.fromtimestamp(timestamp, tz=dt.UTC).strftime("%Y-%m-%d %H:%M")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("action", choices=["record", "list", "app", "catalogue", "swings", "bombs"],
+                        help="record adds the data in this folder as a new crawl, list shows the crawls, app "
+                             "shows an app and catalogue writes a data.csv as they were at --at, swings and "
+                             "bombs show the biggest review score changes and review bombs between --from and --at")
+    parser.add_argument("appid", nargs="?", type=int, help="The app to show, for app")
+    parser.add_argument("-s", "--snapshots", action="store", dest="snapshots", default=SNAPSHOT_PATH,
+                        help="Path of the snapshot database")
+    parser.add_argument("-d", "--db", action="store", dest="db", default="",
+                        help="With record, read the crawl from this SQLite database from store.py instead of the files")
+    parser.add_argument("--taken", action="store", dest="taken", default=None,
+                        help="With record, when the crawl was taken, as a date like 2024-05-01 or a timestamp. "
+                             "Defaults to now")
+    parser.add_argument("--at", action="store", dest="at", default=None,
+                        help="Date to look at the data as of, defaults to the latest crawl")
+    parser.add_argument("--from", action="store", dest="since", default=None,
+                        help="With swings and bombs, date to compare from, defaults to the crawl before --at")
+    parser.add_argument("-n", "--number", action="store", dest="number", type=int, default=20,
+                        help="Number of apps to show")
+    parser.add_argument("--min-reviews", action="store", dest="min_reviews", type=int, default=100,
+                        help="With swings, only show apps with at least this many reviews before and after")
+    parser.add_argument("--min-new", action="store", dest="min_new", type=int, default=50,
+                        help="With bombs, only show apps with at least this many new negative reviews")
+    parser.add_argument("--share", action="store", dest="share", type=float, default=0.5,
+                        help="With bombs, fraction of the new reviews which have to be negative")
+    parser.add_argument("-o", "--out", action="store", dest="out", default=None,
+                        help="With catalogue, file to write to, defaults to data-<crawl>.csv. It only has the "
+                             "columns which are tracked between crawls")
+    args = parser.parse_args()
+
+    with SnapshotStore(args.snapshots) as snapshots:
+        at = snapshots.crawl_at(args.at)
+        if args.action == "record":
+            apps, appids, index = load_crawl(args.db)
+            taken = parse_date(args.taken) if args.taken else None
+            changed_apps, changed_months = snapshots.record(apps, appids, index, taken)
+            print(f"Recorded crawl {snapshots.crawl_at()} of {len(apps.index)} apps, {changed_apps} apps and "
+                  f"{changed_months} months changed")
+        elif args.action == "list":
+            for row in snapshots.crawls().itertuples():
+                print(f"{row.crawl}: {show_date(row.taken)}, {row.apps} apps, {row.changed_apps} apps and "
+                      f"{row.changed_months} months changed")
+        elif not at:
+            parser.error("There aren't any crawls at that date")
+        elif args.action == "app":
+            if args.appid is None:
+                parser.error("app needs an appid")
+            print(snapshots.apps(at, [args.appid]).T.to_string())
+            series = snapshots.series(at, [args.appid])[0]
+            for month in np.nonzero(series.any(axis=1))[0]:
+                print(f"{show_date(MONTH_ARRAY[month])[:7]}: UP {series[month, 0]} DOWN {series[month, 1]}")
+        elif args.action == "catalogue":
+            out = args.out or f"data-{at}.csv"
+            snapshots.apps(at).reset_index().to_csv(out, index=False)
+            print(f"Wrote the catalogue as of crawl {at} to {out}")
+        else:
+            since = snapshots.crawl_at(args.since) if args.since else at - 1
+            with pd.option_context("display.width", 200, "display.max_columns", 20):
+                if args.action == "swings":
+                    print(snapshots.swings(since, at, args.min_reviews, args.number).to_string())
+                else:
+                    print(snapshots.bombs(since, at, args.min_new, args.share, args.number).to_string())
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import warnings
+import numpy as np
+
+RESAMPLES = 1000
+BATCH_SIZE = 32
+# Poisson(1) weights looked up from 2^16 equally likely slices of its distribution, which is
+# several times faster than numpy's poisson and makes no difference at this many resamples.
+_POISSON_CDF = np.cumsum([math.exp(-1) / math.factorial(k) for k in range(20)])
+POISSON_TABLE = np.searchsorted(_POISSON_CDF, (np.arange(2 ** 16) + 0.5) / 2 ** 16).astype(np.uint8)
+
+# The lower bound of the Wilson score interval for the fraction of reviews which are positive,
+# which is lower the fewer reviews there are. nan for games without any reviews, the same as
+# positive / total.
+def wilson_lower(positive, total, z: float = 1.96):
+    positive, total = np.asarray(positive, dtype=np.float64), np.asarray(total, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = positive / total
+        z2 = z * z / total
+        return (p + z2 / 2 - z * np.sqrt(p * (1 - p) / total + z2 / total / 4)) / (1 + z2)
+
+# The rating SteamDB uses, which pulls the fraction of reviews which are positive towards 50%
+# by less the more reviews there are, halving the distance at 9 reviews, a tenth at 99 and
+# so on. nan for games without any reviews.
+def steamdb_rating(positive, total):
+    positive, total = np.asarray(positive, dtype=np.float64), np.asarray(total, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score = positive / total
+        return score - (score - 0.5) * 2 ** -np.log10(total + 1)
+
+# The random number generators for each batch of resamples, worked out from the seed so the
+# results are the same however many threads there are.
+def batch_rngs(resamples: int, seed: int):
+    sizes = [min(BATCH_SIZE, resamples - i) for i in range(0, resamples, BATCH_SIZE)]
+    return list(zip(sizes, (np.random.default_rng(x) for x in np.random.SeedSequence(seed).spawn(len(sizes)))))
+
+# Poisson bootstrap weights for a batch of resamples of n rows. Each row is in each resample
+# a Poisson(1) number of times, which is the same as resampling with replacement for lots of
+# rows but can be done for every row at once.
+def poisson_weights(rng: np.random.Generator, size: int, n: int):
+    return POISSON_TABLE[rng.integers(0, 2 ** 16, (size, n), dtype=np.uint16)]
+
+# Runs func(size, rng) for each batch of resamples on a thread pool, numpy lets go of the
+# GIL for the sums so the threads run at the same time. Returns the stacked results.
+def run_batches(func, resamples: int, seed: int, workers: int):
+    batches = batch_rngs(resamples, seed)
+    if workers <= 1:
+        return np.concatenate([func(size, rng) for size, rng in batches])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(lambda x: func(*x), batches)))
+
+# The (lower, upper) percentiles of the resampled statistics for each group, with alpha
+# split between the two ends. Groups which are empty in every resample get nan.
+def interval(resampled: np.ndarray, alpha: float):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanpercentile(resampled, [alpha / 2 * 100, (1 - alpha / 2) * 100], axis=0)
+    return lower, upper
+
+# Bootstrap confidence intervals for the mean of the values in each group from 0 to n_groups-1,
+# like the means analysis.group_sums is used for. Rows are sorted by group once, so the
+# weighted sums of each group in a batch of resamples are one np.add.reduceat. Returns
+# arrays of the lower and upper bounds, nan for groups without any rows.
+def bootstrap_group_means(groups: np.ndarray, values: np.ndarray, n_groups: int, resamples: int = RESAMPLES,
+                          alpha: float = 0.05, seed: int = 0, workers: int = os.cpu_count()):
+    order = np.argsort(groups, kind="stable")
+    groups, values = np.asarray(groups)[order], np.asarray(values, dtype=np.float64)[order]
+    bounds = np.searchsorted(groups, np.arange(n_groups + 1))
+    filled = bounds[:-1] < bounds[1:] # reduceat can't do empty groups
+
+    def batch(size, rng):
+        result = np.full((size, n_groups), np.nan)
+        if filled.any():
+            weights = poisson_weights(rng, size, len(values))
+            sums = np.add.reduceat(weights * values, bounds[:-1][filled], axis=1)
+            counts = np.add.reduceat(weights, bounds[:-1][filled], axis=1, dtype=np.int64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[:, filled] = sums / counts
+        return result
+
+    return interval(run_batches(batch, resamples, seed, workers), alpha)
+
+# Bootstrap confidence intervals for sum(numerator) / sum(denominator) down each column of
+# two (rows, columns) arrays, resampling the rows, like the review score of every game for
+# each month. Each batch is a matrix product of the weights with the arrays. Returns arrays
+# of the lower and upper bounds for each column.
+def bootstrap_ratio_of_sums(numerator: np.ndarray, denominator: np.ndarray, resamples: int = RESAMPLES,
+                            alpha: float = 0.05, seed: int = 0, workers: int = os.cpu_count()):
+    numerator = np.asarray(numerator, dtype=np.float32)
+    denominator = np.asarray(denominator, dtype=np.float32)
+
+    def batch(size, rng):
+        weights = poisson_weights(rng, size, len(numerator)).astype(np.float32)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (weights @ numerator).astype(np.float64) / (weights @ denominator)
+
+    return interval(run_batches(batch, resamples, seed, workers), alpha)
@@ -0,0 +1,337 @@
+from argparse import ArgumentParser
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from utils import MONTH_ARRAY, MONTHS, month_slots
+
+DB_PATH = "steam.db"
+APP_COLUMNS = ["appid", "name", "last_modified", "price_change_number", "type"]
+REVIEW_COLUMNS = ["total_reviews", "positive_reviews", "negative_reviews", "review_desc", "review_score",
+                  "reviews_fetched"]
+
+# series only has rows for the months with reviews, the rest are zero.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS apps (
+    appid INTEGER PRIMARY KEY,
+    name TEXT,
+    last_modified INTEGER NOT NULL DEFAULT 0,
+    price_change_number INTEGER NOT NULL DEFAULT 0,
+    type TEXT
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    appid INTEGER PRIMARY KEY REFERENCES apps(appid),
+    total_reviews INTEGER NOT NULL,
+    positive_reviews INTEGER NOT NULL,
+    negative_reviews INTEGER NOT NULL,
+    review_desc TEXT NOT NULL,
+    review_score INTEGER NOT NULL,
+    reviews_fetched INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS histograms (
+    appid INTEGER PRIMARY KEY REFERENCES apps(appid),
+    review_start INTEGER NOT NULL,
+    time_series TEXT NOT NULL,
+    histogram_fetched INTEGER NOT NULL,
+    histogram_reviews INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS series (
+    appid INTEGER NOT NULL REFERENCES apps(appid),
+    month INTEGER NOT NULL,
+    up INTEGER NOT NULL,
+    down INTEGER NOT NULL,
+    PRIMARY KEY (appid, month)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS apps_type ON apps(type);
+CREATE INDEX IF NOT EXISTS reviews_total ON reviews(total_reviews);
+CREATE INDEX IF NOT EXISTS histograms_start ON histograms(review_start);
+"""
+
+class Store:
+    '''
+    Store(path: str)
+
+    The SQLite database the stages can use instead of data.csv, time_data.json and
+    the normalised files. apps has what csvmaker.py gets from the app list, reviews
+    the summaries from review-getter.py, histograms the raw time series from
+    review-timeseries.py and series the monthly counts from data-normaliser.py.
+    Each write is one transaction, so only the rows being changed are touched and
+    a crash loses at most the batch being written.
+    '''
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = [x[1] for x in self.conn.execute("PRAGMA table_info(histograms)")]
+        if "histogram_reviews" not in columns: # Databases made before it was added
+            self.conn.execute("ALTER TABLE histograms ADD COLUMN histogram_reviews INTEGER NOT NULL DEFAULT 0")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upsert_apps(self, df: pd.DataFrame):
+        '''
+        Adds the apps in df, with the columns of data.csv, or updates them if they are
+        already there. Apps without a type keep the one they have.
+        '''
+        df = df.reindex(columns=APP_COLUMNS).fillna({"last_modified": 0, "price_change_number": 0})
+        rows = [(int(appid), name, int(modified), int(change), None if pd.isna(type_) else type_)
+                for appid, name, modified, change, type_ in df.itertuples(index=False)]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO apps VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(appid) DO UPDATE SET name = excluded.name,
+                    last_modified = excluded.last_modified,
+                    price_change_number = excluded.price_change_number,
+                    type = coalesce(excluded.type, apps.type)
+            """, rows)
+        return len(rows)
+
+    def upsert_reviews(self, records: list):
+        '''
+        Adds or replaces the review summaries, as made by review-getter.py.
+        '''
+        with self.conn:
+            self.conn.executemany(f"""
+                INSERT OR REPLACE INTO reviews VALUES (:appid, {', '.join(':' + x for x in REVIEW_COLUMNS)})
+            """, records)
+
+    def upsert_histograms(self, records: list):
+        '''
+        Adds or replaces the review histograms, as made by review-timeseries.py.
+        histogram_reviews is the app's total_reviews when it was fetched, 0 if not given.
+        '''
+        rows = [{"histogram_reviews": 0, **record, "time_series": json.dumps(record["time_series"])}
+                for record in records]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO histograms
+                (appid, review_start, time_series, histogram_fetched, histogram_reviews)
+                VALUES (:appid, :review_start, :time_series, :histogram_fetched, :histogram_reviews)
+            """, rows)
+
+    def write_series(self, appids, counts: np.ndarray):
+        '''
+        Replaces the monthly series of the apps with the (apps, months, 2) counts,
+        the months being MONTHS. Only the months with reviews are stored.
+        '''
+        appids = np.asarray(appids, dtype=np.int64)
+        games, months = np.nonzero(counts.any(axis=2))
+        rows = zip(appids[games].tolist(), MONTH_ARRAY[months].tolist(),
+                   counts[games, months, 0].tolist(), counts[games, months, 1].tolist())
+        with self.conn:
+            self.conn.executemany("DELETE FROM series WHERE appid = ?", ((x,) for x in appids.tolist()))
+            self.conn.executemany("INSERT INTO series VALUES (?, ?, ?, ?)", rows)
+
+    # Works out the condition for rows needing a refetch, see workqueue.stale_rows.
+    def _stale(self, fetched: str, incremental: bool, max_age):
+        if not incremental:
+            return "", {}
+        condition = f" OR a.last_modified > {fetched}"
+        if max_age is not None:
+            condition += f" OR {fetched} < :cutoff"
+        return condition, {"cutoff": time.time() - max_age if max_age is not None else 0}
+
+    def pending_reviews(self, incremental: bool = False, max_age = None):
+        '''
+        Finds the apps without a review summary, and with incremental the ones which
+        have changed since it was fetched or were fetched more than max_age seconds ago.
+
+        Returns:
+        list of appids
+        '''
+        stale, params = self._stale("r.reviews_fetched", incremental, max_age)
+        return [x for (x,) in self.conn.execute(f"""
+            SELECT a.appid FROM apps a LEFT JOIN reviews r USING (appid)
+            WHERE r.appid IS NULL{stale} ORDER BY a.appid
+        """, params)]
+
+    def pending_histograms(self, incremental: bool = False, max_age = None, min_reviews: int = 10):
+        '''
+        Finds the apps with at least min_reviews which don't have a histogram, and with
+        incremental the ones which have changed since it was fetched or were fetched
+        more than max_age seconds ago.
+
+        Returns:
+        list of appids
+        '''
+        stale, params = self._stale("h.histogram_fetched", incremental, max_age)
+        return [x for (x,) in self.conn.execute(f"""
+            SELECT a.appid FROM apps a JOIN reviews r USING (appid) LEFT JOIN histograms h USING (appid)
+            WHERE r.total_reviews >= :min_reviews AND (h.appid IS NULL{stale}) ORDER BY a.appid
+        """, {**params, "min_reviews": min_reviews})]
+
+    def histogram_schedule(self, min_reviews: int = 10):
+        '''
+        Reads what scheduler.py needs to decide which histograms to fetch for the apps
+        with at least min_reviews: their review summaries, and when their histogram was
+        fetched and how many reviews they had then, 0 if it never has been.
+
+        Returns:
+        pd.DataFrame
+        '''
+        return pd.read_sql_query("""
+            SELECT a.appid, a.last_modified, r.total_reviews, COALESCE(h.review_start, 0) AS review_start,
+                   COALESCE(h.histogram_fetched, 0) AS histogram_fetched,
+                   COALESCE(h.histogram_reviews, 0) AS histogram_reviews
+            FROM apps a JOIN reviews r USING (appid) LEFT JOIN histograms h USING (appid)
+            WHERE r.total_reviews >= :min_reviews ORDER BY a.appid
+        """, self.conn, params={"min_reviews": min_reviews})
+
+    def read_apps(self, min_reviews: int = None, max_reviews: int = None, type_: str = None):
+        '''
+        Reads the apps with review summaries, the same as data.csv, filtered on the
+        indexed columns in the query rather than after loading. min_reviews is
+        inclusive and max_reviews exclusive.
+
+        Returns:
+        pd.DataFrame
+        '''
+        where, params = self._filters(min_reviews, max_reviews, type_)
+        return pd.read_sql_query(f"""
+            SELECT a.*, {', '.join('r.' + x for x in REVIEW_COLUMNS)}
+            FROM apps a JOIN reviews r USING (appid){where} ORDER BY a.appid
+        """, self.conn, params=params)
+
+    def read_time_data(self, min_reviews: int = None, max_reviews: int = None, type_: str = None):
+        '''
+        Reads the apps with histograms, the same as normalised_data.csv, with the
+        review_start moved to the start of its month.
+
+        Returns:
+        pd.DataFrame
+        '''
+        where, params = self._filters(min_reviews, max_reviews, type_)
+        df = pd.read_sql_query(f"""
+            SELECT a.*, {', '.join('r.' + x for x in REVIEW_COLUMNS)}, h.review_start, h.histogram_fetched
+            FROM apps a JOIN reviews r USING (appid) JOIN histograms h USING (appid){where}
+            ORDER BY a.appid
+        """, self.conn, params=params)
+        df["review_start"] = MONTH_ARRAY[month_slots(df["review_start"])]
+        return df
+
+    def read_histograms(self, chunk_size: int = 10000):
+        '''
+        Yields the raw histograms in chunks of DataFrames with the columns appid,
+        review_start and time_series, for data-normaliser.py.
+        '''
+        chunks = pd.read_sql_query("SELECT appid, review_start, time_series FROM histograms ORDER BY appid",
+                                   self.conn, chunksize=chunk_size)
+        for chunk in chunks:
+            chunk["time_series"] = [json.loads(x) for x in chunk["time_series"]]
+            yield chunk
+
+    def read_series(self, appids):
+        '''
+        Reads the monthly series of the apps into a (apps, months, 2) array, in the
+        same order as appids and with the months being MONTHS. Only the rows of the
+        apps asked for are read, by joining series with a temporary table of them.
+
+        Returns:
+        np.ndarray
+        '''
+        appids = np.asarray(appids, dtype=np.int64)
+        result = np.zeros((len(appids), len(MONTHS), 2), dtype=np.int32)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (appid INTEGER PRIMARY KEY)")
+        self.conn.execute("DELETE FROM wanted")
+        self.conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((x,) for x in appids.tolist()))
+        rows = np.array(self.conn.execute("SELECT appid, month, up, down FROM series JOIN wanted USING (appid)")
+                        .fetchall(), dtype=np.int64).reshape(-1, 4)
+        self.conn.commit()
+        if len(appids) == 0 or len(rows) == 0:
+            return result
+        order = np.argsort(appids)
+        found = order[np.minimum(np.searchsorted(appids, rows[:, 0], sorter=order), len(appids) - 1)]
+        keep = appids[found] == rows[:, 0]
+        result[found[keep], np.searchsorted(MONTH_ARRAY, rows[keep, 1])] = rows[keep, 2:]
+        return result
+
+    # Makes the WHERE clause for filtering apps on the indexed columns.
+    def _filters(self, min_reviews, max_reviews, type_):
+        conditions, params = [], {}
+        if min_reviews is not None:
+            conditions.append("r.total_reviews >= :min_reviews")
+            params["min_reviews"] = min_reviews
+        if max_reviews is not None:
+            conditions.append("r.total_reviews < :max_reviews")
+            params["max_reviews"] = max_reviews
+        if type_ is not None:
+            conditions.append("a.type = :type")
+            params["type"] = type_
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def close(self):
+        '''
+        Closes the connection to the database.
+        '''
+        self.conn.close()
+
+
+# Loads data.csv, time_data.json and the normalised series from the current folder into
+# the store, whichever of them exist.
+def import_files(store: Store):
+    if os.path.exists("data.csv"):
+        df = pd.read_csv("data.csv")
+        store.upsert_apps(df)
+        if "review_desc" in df.columns:
+            fetched = df.loc[df["review_desc"] != "Unknown"].reindex(columns=["appid"] + REVIEW_COLUMNS)
+            fetched = fetched.fillna({"reviews_fetched": 0}).astype({"appid": "int64", "reviews_fetched": "int64"})
+            store.upsert_reviews(fetched.to_dict("records"))
+    if os.path.exists("time_data.json"):
+        time_df = pd.read_json("time_data.json")
+        time_df = time_df.loc[time_df["time_series"] != "Unknown"]
+        time_df = time_df.reindex(columns=["appid", "review_start", "time_series", "histogram_fetched",
+                                           "histogram_reviews"])
+        time_df = time_df.fillna({"histogram_fetched": 0, "histogram_reviews": 0}).astype(
+            {"appid": "int64", "histogram_fetched": "int64", "histogram_reviews": "int64"})
+        store.upsert_histograms(time_df.to_dict("records"))
+    if os.path.exists("normalised_series.npy"):
+        appids = pd.read_csv("normalised_data.csv", usecols=["appid"])["appid"]
+        series = np.load("normalised_series.npy", mmap_mode="r")
+        months = np.load("normalised_months.npy")
+        # The months may not line up with MONTHS if they were normalised in an earlier month
+        keep = np.isin(months, MONTH_ARRAY)
+        counts = np.zeros((len(appids), len(MONTHS), 2), dtype=np.int32)
+        counts[:, np.searchsorted(MONTH_ARRAY, months[keep])] = series[:, keep]
+        store.write_series(appids, counts)
+
+# Writes data.csv and time_data.json from the store, for the scripts run without --db.
+def export_files(store: Store):
+    df = pd.read_sql_query(f"""
+        SELECT a.*, {', '.join('r.' + x for x in REVIEW_COLUMNS)}
+        FROM apps a LEFT JOIN reviews r USING (appid) ORDER BY a.appid
+    """, store.conn)
+    df["review_desc"] = df["review_desc"].fillna("Unknown")
+    df = df.fillna({x: 0 for x in REVIEW_COLUMNS if x != "review_desc"})
+    df.astype({x: "int64" for x in REVIEW_COLUMNS if x != "review_desc"}).to_csv("data.csv", index=False)
+    time_df = pd.read_sql_query(f"""
+        SELECT a.*, {', '.join('r.' + x for x in REVIEW_COLUMNS)}, h.review_start, h.time_series, h.histogram_fetched,
+               h.histogram_reviews
+        FROM apps a JOIN reviews r USING (appid) JOIN histograms h USING (appid) ORDER BY a.appid
+    """, store.conn)
+    time_df["time_series"] = [json.loads(x) for x in time_df["time_series"]]
+    time_df.to_json("time_data.json", index=False)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("action", choices=["import", "export"],
+                        help="import loads the files in this folder into the database, export writes "
+                             "data.csv and time_data.json from it")
+    parser.add_argument("-d", "--db", action="store", dest="db", default=DB_PATH,
+                        help="Path of the database")
+    args = parser.parse_args()
+
+    with Store(args.db) as store:
+        if args.action == "import":
+            import_files(store)
+        else:
+            export_files(store)
+    print(f"Done {args.action} with {args.db}")
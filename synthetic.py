@@ -0,0 +1,213 @@
+from argparse import ArgumentParser
+import base64
+import datetime as dt
+import json
+import os
+import numpy as np
+import pandas as pd
+
+DAY = 86400
+PAGE_SIZE = 10000
+FIRST_REVIEW = int(dt.datetime(2010, 10, 15, tzinfo=dt.UTC).timestamp())
+# The catalogue is made as if it was crawled on this date rather than today, so the same seed
+# gives the same catalogue, histograms and bench timings whenever it is run.
+NOW = int(dt.datetime(2024, 6, 1, tzinfo=dt.UTC).timestamp())
+
+# The review descriptions steam gives, from the lowest score to the highest.
+DESCRIPTIONS = ["No user reviews", "Overwhelmingly Negative", "Very Negative", "Negative",
+                "Mostly Negative", "Mixed", "Mostly Positive", "Positive", "Very Positive",
+                "Overwhelmingly Positive"]
+
+# Words the synthetic reviews are made of, so the text has some sentiment to find.
+POSITIVE_WORDS = ["great", "fun", "amazing", "love", "masterpiece", "addictive", "beautiful", "recommend"]
+NEGATIVE_WORDS = ["boring", "broken", "buggy", "refund", "crash", "terrible", "overpriced", "grindy"]
+NEUTRAL_WORDS = ["game", "the", "story", "hours", "multiplayer", "graphics", "price", "update", "and", "it"]
+LANGUAGES = ["english", "english", "english", "schinese", "russian", "spanish", "german", "brazilian"]
+
+# Works out the review_score and review_score_desc steam would give an app.
+def review_score(total: int, positive: int):
+    if total == 0:
+        return 0, DESCRIPTIONS[0]
+    ratio = positive / total
+    if ratio >= 0.8:
+        score = 9 if total >= 500 and ratio >= 0.95 else 8 if total >= 50 else 7 if total >= 10 else 6
+    elif ratio >= 0.7:
+        score = 6
+    elif ratio >= 0.4:
+        score = 5
+    elif ratio >= 0.2:
+        score = 4
+    else:
+        score = 1 if total >= 500 else 2 if total >= 50 else 3
+    return score, DESCRIPTIONS[score]
+
+# Makes the apps for a synthetic catalogue as a DataFrame. The same n_apps and seed
+# always give the same catalogue.
+def make_catalogue(n_apps: int, seed: int = 0, dlc_fraction: float = 0.3):
+    rng = np.random.default_rng(seed)
+    appids = np.sort(rng.choice(np.arange(10, max(n_apps * 20, 4000000), 10), n_apps, replace=False))
+    df = pd.DataFrame({"appid": appids})
+    df["name"] = [f"Synthetic App {x}" for x in appids]
+    df["last_modified"] = rng.integers(FIRST_REVIEW, NOW, n_apps)
+    df["price_change_number"] = rng.integers(0, 30000000, n_apps)
+    df["type"] = np.where(rng.random(n_apps) < dlc_fraction, "DLC", "Game")
+    # Lots of apps have no reviews, the rest have a long tail up to CS2's ~9 million
+    totals = np.minimum(np.exp(rng.normal(2.5, 2.2, n_apps)), 9000000).astype(np.int64)
+    totals[rng.random(n_apps) < 0.35] = 0
+    df["total_reviews"] = totals
+    df["positive_reviews"] = rng.binomial(totals, rng.beta(5, 2, n_apps))
+    df["negative_reviews"] = totals - df["positive_reviews"]
+    scores = [review_score(total, pos) for total, pos in zip(totals, df["positive_reviews"])]
+    df["review_desc"] = [x[1] for x in scores]
+    df["review_score"] = [x[0] for x in scores]
+    df["reviews_fetched"] = NOW
+    starts = rng.integers(FIRST_REVIEW, NOW - 30 * DAY, n_apps)
+    df["review_start"] = starts - starts % DAY # Midnight UTC of the release day
+    return df
+
+# The GetAppList response for a page of apps.
+def app_list_page(apps: pd.DataFrame, have_more: bool):
+    response = {"apps": apps[["appid", "name", "last_modified", "price_change_number"]].to_dict("records")}
+    if have_more:
+        response["have_more_results"] = True
+        response["last_appid"] = int(apps["appid"].iloc[-1])
+    return {"response": response}
+
+# The appreviews response for an app, with num_per_page=0 so just the summary.
+def review_summary(app: dict):
+    return {
+        "success": 1,
+        "query_summary": {
+            "num_reviews": 0,
+            "review_score": int(app["review_score"]),
+            "review_score_desc": app["review_desc"],
+            "total_positive": int(app["positive_reviews"]),
+            "total_negative": int(app["negative_reviews"]),
+            "total_reviews": int(app["total_reviews"])
+        }
+    }
+
+# The appreviewhistogram response for an app. Games which started getting reviews in the
+# last two years get weekly rollups starting on their release day, older ones get
+# monthly rollups. Empty rollups are left out like steam does.
+def review_histogram(app: dict, seed: int = 0):
+    rng = np.random.default_rng([seed, int(app["appid"])])
+    start = int(app["review_start"])
+    if NOW - start < 2 * 365 * DAY:
+        rollup_type = "week"
+        dates = np.arange(start, NOW, 7 * DAY)
+    else:
+        rollup_type = "month"
+        first = np.datetime64(start, "s").astype("datetime64[M]")
+        dates = np.arange(first, np.datetime64(NOW, "s").astype("datetime64[M]") + 1)
+        dates = dates.astype("datetime64[s]").astype(np.int64)
+    # Most reviews come soon after release, then tail off
+    weights = np.exp(-np.arange(len(dates)) / max(len(dates) / 6, 1)) * rng.random(len(dates))
+    counts = rng.multinomial(int(app["total_reviews"]), weights / weights.sum())
+    ups = rng.binomial(counts, int(app["positive_reviews"]) / max(int(app["total_reviews"]), 1))
+    rollups = [{"date": int(date), "recommendations_up": int(up), "recommendations_down": int(count - up)}
+               for date, up, count in zip(dates, ups, counts) if count]
+    return {
+        "success": 1,
+        "results": {
+            "start_date": start,
+            "end_date": NOW,
+            "weeks": [],
+            "rollup_type": rollup_type,
+            "rollups": rollups
+        }
+    }
+
+# Turns the cursor for a page of reviews into the number of reviews before it and back.
+# The first page's cursor is "*" like on steam.
+def decode_cursor(cursor: str):
+    return 0 if cursor == "*" else int(base64.b64decode(cursor))
+
+def encode_cursor(offset: int):
+    return base64.b64encode(str(offset).encode()).decode()
+
+# Makes one synthetic review, the same every time for the same app, position and seed.
+def make_review(app: dict, offset: int, seed: int = 0):
+    rng = np.random.default_rng([seed, int(app["appid"]), offset])
+    voted_up = bool(rng.random() < int(app["positive_reviews"]) / max(int(app["total_reviews"]), 1))
+    words = rng.choice(NEUTRAL_WORDS, rng.integers(3, 40)).tolist()
+    words += rng.choice(POSITIVE_WORDS if voted_up else NEGATIVE_WORDS, rng.integers(1, 4)).tolist()
+    rng.shuffle(words)
+    created = int(rng.integers(int(app["review_start"]), NOW))
+    playtime = int(rng.lognormal(6, 1.5))
+    return {
+        "recommendationid": str(int(app["appid"]) * 100000000 + offset),
+        "author": {
+            "steamid": str(76561197960265728 + int(rng.integers(0, 10 ** 9))),
+            "num_games_owned": int(rng.integers(1, 2000)),
+            "num_reviews": int(rng.integers(1, 200)),
+            "playtime_forever": playtime + int(rng.integers(0, 1000)),
+            "playtime_last_two_weeks": int(rng.integers(0, 600)),
+            "playtime_at_review": playtime,
+            "last_played": NOW
+        },
+        "language": str(rng.choice(LANGUAGES)),
+        "review": " ".join(words),
+        "timestamp_created": created,
+        "timestamp_updated": created,
+        "voted_up": voted_up,
+        "votes_up": int(rng.poisson(2)),
+        "votes_funny": int(rng.poisson(0.5)),
+        "weighted_vote_score": round(float(rng.random()), 6),
+        "comment_count": int(rng.poisson(0.2)),
+        "steam_purchase": bool(rng.random() < 0.9),
+        "received_for_free": bool(rng.random() < 0.05),
+        "written_during_early_access": False
+    }
+
+# The appreviews response for a page of an app's reviews, walked with the cursor. The
+# last page has no reviews and gives back the same cursor, like steam does.
+def review_page(app: dict, cursor: str = "*", num_per_page: int = 20, seed: int = 0):
+    offset = decode_cursor(cursor)
+    end = min(offset + min(num_per_page, 100), int(app["total_reviews"]))
+    reviews = [make_review(app, x, seed) for x in range(offset, end)]
+    summary = review_summary(app)["query_summary"] if offset == 0 else {}
+    return {
+        "success": 1,
+        "query_summary": {**summary, "num_reviews": len(reviews)},
+        "reviews": reviews,
+        "cursor": encode_cursor(end) if reviews else cursor
+    }
+
+# Writes the GetAppList pages for the apps of one type, the way AppIDList.py does.
+def write_pages(apps: pd.DataFrame, filename: str, out_dir: str):
+    starts = range(0, max(len(apps.index), 1), PAGE_SIZE)
+    for i, start in enumerate(starts):
+        page = app_list_page(apps.iloc[start:start+PAGE_SIZE], start + PAGE_SIZE < len(apps.index))
+        with open(os.path.join(out_dir, f"{filename}{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(page, f)
+
+# Writes a synthetic catalogue in the shape each stage of the pipeline expects: the
+# GetAppList pages from AppIDList.py, data.csv as review-getter.py leaves it, and
+# time_data.json as review-timeseries.py leaves it.
+def write_catalogue(n_apps: int, out_dir: str, seed: int = 0):
+    os.makedirs(out_dir, exist_ok=True)
+    df = make_catalogue(n_apps, seed)
+    write_pages(df.loc[df["type"] == "Game"], "gamedata", out_dir)
+    write_pages(df.loc[df["type"] == "DLC"], "DLCdata", out_dir)
+    df.drop(columns="review_start").to_csv(os.path.join(out_dir, "data.csv"), index=False)
+    time_df = df.loc[df["total_reviews"] >= 10].reset_index(drop=True)
+    time_df["time_series"] = [review_histogram(app, seed)["results"]["rollups"]
+                              for app in time_df.to_dict("records")]
+    time_df["histogram_fetched"] = NOW
+    time_df["histogram_reviews"] = time_df["total_reviews"]
+    time_df.to_json(os.path.join(out_dir, "time_data.json"), index=False)
+    return df
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("apps", type=int, help="Number of apps to make")
+    parser.add_argument("-o", "--out", action="store", dest="out", default="synthetic",
+                        help="Folder to write the files to")
+    parser.add_argument("-s", "--seed", action="store", dest="seed", type=int, default=0,
+                        help="Seed for the random numbers, the same seed gives the same files")
+    args = parser.parse_args()
+
+    write_catalogue(args.apps, args.out, args.seed)
+    print(f"Wrote a catalogue of {args.apps} apps to {args.out}")
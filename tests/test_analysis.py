@@ -0,0 +1,38 @@
+import os
+import sys
+import matplotlib
+import numpy as np
+import pandas as pd
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import analysis
+import cache
+from utils import MONTHS
+
+# A few games released in every other month, so most months have no games and are nan.
+def release_frame():
+    starts = [MONTHS[i] for i in range(0, len(MONTHS), 2) for _ in range(3)]
+    total = np.full(len(starts), 200)
+    positive = (np.arange(len(starts)) * 7) % 200
+    return pd.DataFrame({"type": "game", "review_start": starts, "total_reviews": total,
+                         "positive_reviews": positive})
+
+# The second plot reads the data back from the cache, where the nans are new floats rather
+# than np.nan itself, and the trend line has to come out the same as the first time.
+def test_release_trend_same_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "enabled", True)
+    df = release_frame()
+    trends = []
+    for _ in range(2):
+        fig, ax = plt.subplots()
+        analysis.plot_game_time_data(ax, df, (100, 1000))
+        trends.append(ax.get_lines()[-1].get_ydata())
+        plt.close(fig)
+    assert len(os.listdir(tmp_path)) > 0
+    assert np.isfinite(trends[0]).all()
+    assert np.allclose(trends[0], trends[1])
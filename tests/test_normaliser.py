@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+import sys
+import time
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from utils import MONTHS
+
+# The script has a hyphen in its name, so it can't be imported the normal way.
+spec = importlib.util.spec_from_file_location("data_normaliser", os.path.join(ROOT, "data-normaliser.py"))
+normaliser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(normaliser)
+
+# Histograms and what the original per-point normaliser made of them, run in UTC: monthly
+# games with missing months, weekly games with weeks running into the next month and year,
+# and dates given as strings like steam sometimes sends them.
+with open(os.path.join(ROOT, "tests", "golden", "normaliser.json"), encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+# The non-zero months of a normalised game, as [timestamp, up, down].
+def non_zero_months(counts):
+    return [[MONTHS[i], int(up), int(down)] for i, (up, down) in enumerate(counts) if up or down]
+
+# Runs with the process in a time zone, putting it back after.
+@pytest.fixture
+def time_zone():
+    old = os.environ.get("TZ")
+    def set_zone(zone):
+        os.environ["TZ"] = zone
+        time.tzset()
+    yield set_zone
+    if old is None:
+        os.environ.pop("TZ", None)
+    else:
+        os.environ["TZ"] = old
+    time.tzset()
+
+@pytest.mark.parametrize("name", list(GOLDEN))
+def test_matches_golden(name):
+    counts = normaliser.normalise_month_data([GOLDEN[name]["histogram"]])[0]
+    assert non_zero_months(counts) == GOLDEN[name]["months"]
+
+def test_chunk_of_games_matches_one_at_a_time():
+    histograms = [x["histogram"] for x in GOLDEN.values()]
+    together = normaliser.normalise_month_data(histograms)
+    for i, histogram in enumerate(histograms):
+        assert np.array_equal(together[i], normaliser.normalise_month_data([histogram])[0])
+
+# The original split weeks between months by the machine's local time, so away from UTC the
+# reviews near the end of a month went in the wrong month. Months are midnight UTC on the
+# 1st, so the split is done in UTC now whatever the local time zone is. This is a deliberate
+# change: the golden files have what the original gave in New York to show the difference.
+@pytest.mark.parametrize("zone", ["UTC", "America/New_York", "Asia/Tokyo"])
+def test_weeks_split_in_utc(zone, time_zone):
+    time_zone(zone)
+    for name, golden in GOLDEN.items():
+        counts = normaliser.normalise_month_data([golden["histogram"]])[0]
+        assert non_zero_months(counts) == golden["months"]
+        if "months_before_in_new_york" in golden:
+            assert non_zero_months(counts) != golden["months_before_in_new_york"]
+
+def test_review_start_moves_to_month():
+    starts = np.array([MONTHS[5], MONTHS[5] + 86400 * 3 + 7, MONTHS[6] - 1])
+    assert normaliser.normalise_review_start_data(starts).tolist() == [MONTHS[5], MONTHS[5], MONTHS[5]]
@@ -0,0 +1,54 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import scheduler
+from scheduler import DAY
+
+NOW = 1800000000
+
+# Apps with 500 reviews, in the 30 day tier, released long before NOW, with their
+# histograms fetched days ago when they had histogram_reviews reviews.
+def apps(days, histogram_reviews, total_reviews = 500):
+    n = len(days)
+    return pd.DataFrame({
+        "appid": np.arange(1, n + 1),
+        "total_reviews": np.broadcast_to(total_reviews, n),
+        "review_start": np.zeros(n),
+        "histogram_fetched": [NOW - x * DAY if x is not None else 0 for x in days],
+        "histogram_reviews": np.broadcast_to(histogram_reviews, n),
+    })
+
+def test_never_fetched_first():
+    assert scheduler.priorities(apps([None], 0), NOW).tolist() == [np.inf]
+
+# Histograms fetched before histogram_reviews was recorded have it as 0. How many reviews
+# they gained isn't known, so they wait for the tier's 30 days like an unchanged app would.
+def test_unknown_count_due_on_tier_interval():
+    priorities = scheduler.priorities(apps([8, 29, 31, 60], 0), NOW)
+    assert np.isnan(priorities[:2]).all()
+    assert np.isfinite(priorities[2:]).all()
+    assert priorities[3] > priorities[2]
+
+# Gaining 10% of the reviews makes an app due before its time is up, and gaining less
+# doesn't.
+def test_growth_due_early():
+    priorities = scheduler.priorities(apps([2, 2, 2], [455, 450, 400]), NOW)
+    assert np.isnan(priorities[0])
+    assert np.isfinite(priorities[1:]).all()
+    assert priorities[2] > priorities[1]
+
+def test_too_few_reviews_never_due():
+    priorities = scheduler.priorities(apps([None, 1000], [0, 5], total_reviews = 9), NOW)
+    assert np.isnan(priorities).all()
+
+# schedule takes the most needed first, never fetched before due, and skips the ones
+# that aren't due. App 3 hasn't changed but is fetched anyway after MAX_SKIPS intervals.
+def test_schedule_budget_order():
+    df = apps([2, None, 130, 2, 2], [400, 0, 500, 450, 499])
+    assert scheduler.schedule(df, now = NOW) == [2, 1, 3, 4]
+    assert scheduler.schedule(df, 2, NOW) == [2, 1]
+    assert scheduler.schedule(df, 0, NOW) == []
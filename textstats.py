@@ -0,0 +1,382 @@
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import heapq
+import json
+import os
+import re
+from itertools import islice
+import numpy as np
+import pandas as pd
+from cache import file_fingerprint
+from metrics import Metrics, write_text
+from shards import REVIEW_DIR, find_shards, read_shard
+from utils import MonthSeries, MONTH_ARRAY, MONTHS, month_slots, worker_context
+
+TEXT_DIR = "text_stats"
+SKETCH_WIDTH = 2 ** 18
+SKETCH_DEPTH = 4
+CHUNK_SIZE = 5000
+# The groups counted in the sketch. The others, one for each month and app, are too many
+# small groups to share it with so each gets its own HeavyHitters.
+SKETCH_GROUPS = ("all", "positive", "negative")
+# The columns of the (apps, months, 5) grid for each app and month: the number of reviews,
+# how many were voted up, how many have text with a positive and a negative sentiment score,
+# and the sum of the sentiment scores.
+REVIEWS, VOTED_UP, POSITIVE, NEGATIVE, SCORE = range(5)
+
+# A small AFINN style lexicon of words which come up in game reviews, scored from -3 to 3.
+# Use --lexicon to load a bigger one.
+LEXICON = {
+    "amazing": 3, "masterpiece": 3, "excellent": 3, "brilliant": 3, "perfect": 3, "awesome": 3,
+    "love": 3, "great": 3, "beautiful": 2, "fun": 2, "good": 2, "enjoy": 2, "enjoyed": 2,
+    "addictive": 2, "recommend": 2, "best": 2, "polished": 2, "charming": 2, "worth": 1,
+    "nice": 1, "solid": 1, "decent": 1, "like": 1, "relaxing": 1, "okay": 0,
+    "meh": -1, "grindy": -1, "repetitive": -1, "overpriced": -2, "boring": -2, "bad": -2,
+    "buggy": -2, "crash": -2, "crashes": -2, "lag": -2, "laggy": -2, "refund": -2, "refunded": -2,
+    "unplayable": -3, "broken": -3, "terrible": -3, "awful": -3, "worst": -3, "garbage": -3,
+    "scam": -3, "hate": -3, "waste": -2, "disappointing": -2, "disappointed": -2,
+}
+NEGATIONS = {"not", "no", "never", "don't", "doesn't", "isn't", "wasn't", "can't", "won't"}
+# Left out of the token and n-gram counts so the top ones say something about the game.
+STOP_WORDS = {
+    "a", "an", "and", "the", "it", "it's", "is", "was", "are", "be", "to", "of", "in", "on", "for",
+    "with", "this", "that", "i", "i'm", "you", "my", "but", "or", "so", "as", "at", "have", "has",
+    "if", "just", "they", "there", "its", "me", "do", "get", "can", "all", "from", "by", "up",
+}
+TOKEN_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+class CountMinSketch:
+    '''
+    CountMinSketch(width: int, depth: int)
+
+    Approximate counts of strings in a fixed amount of memory. Each string adds to one
+    cell in each of the depth rows and its count is the smallest of those cells, which
+    is never too low and with probability 1 - e^-depth is too high by no more than
+    e/width of everything counted. Sketches of the same size merge by adding them up.
+    '''
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def cells(self, keys: list):
+        '''
+        Hashes the keys into a cell in each row, with two halves of one blake2b hash
+        combined differently for each row. hash() can't be used as it is different in
+        every process.
+
+        Returns:
+        (depth, len(keys)) np.ndarray of column indexes
+        '''
+        depth, width = self.table.shape
+        hashes = np.frombuffer(b"".join(hashlib.blake2b(x.encode("utf-8"), digest_size=8).digest()
+                                        for x in keys), dtype=np.uint64)
+        first, second = hashes & np.uint64(0xffffffff), (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(depth, dtype=np.uint64)[:, None]
+        return ((first + rows * second) % np.uint64(width)).astype(np.int64)
+
+    def add(self, keys: list, counts: list):
+        '''
+        Adds the counts to the keys.
+        '''
+        if keys:
+            cells = self.cells(keys)
+            for row in range(len(cells)):
+                np.add.at(self.table[row], cells[row], np.asarray(counts, dtype=np.int64))
+
+    def query(self, keys: list):
+        '''
+        Estimates the counts of the keys.
+
+        Returns:
+        np.ndarray of int64 counts
+        '''
+        if not keys:
+            return np.zeros(0, dtype=np.int64)
+        cells = self.cells(keys)
+        return self.table[np.arange(len(cells))[:, None], cells].min(axis=0)
+
+
+class HeavyHitters:
+    '''
+    HeavyHitters(keep: int)
+
+    The most common strings in a group, counted exactly in keep counters with the
+    Misra-Gries algorithm. Whenever there are more than keep counters the (keep+1)th
+    largest count is taken off all of them and the ones left at 0 are dropped, so counts
+    are never too high and are too low by no more than error(), at most
+    total / (keep + 1). Anything more common than that is always kept. They merge the
+    same way, by adding up the counters and then cutting them back to keep.
+    '''
+    def __init__(self, keep: int = 100):
+        self.keep = keep
+        self.counts = {}
+        self.total = 0
+
+    def add(self, counts: dict, total: int = None):
+        '''
+        Adds exact counts of some strings, or the counters of another HeavyHitters along
+        with its total.
+        '''
+        self.total += sum(counts.values()) if total is None else total
+        for gram, count in counts.items():
+            self.counts[gram] = self.counts.get(gram, 0) + count
+        if len(self.counts) > self.keep:
+            cut = heapq.nlargest(self.keep + 1, self.counts.values())[-1]
+            self.counts = {gram: count - cut for gram, count in self.counts.items() if count > cut}
+
+    def error(self):
+        '''
+        The most any count can be too low by.
+
+        Returns:
+        float
+        '''
+        return (self.total - sum(self.counts.values())) / (self.keep + 1)
+
+    def top(self, k: int = 20):
+        '''
+        Gets the most common strings.
+
+        Returns:
+        list of (gram, count), most common first
+        '''
+        return sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+
+class TextStats:
+    '''
+    TextStats(width: int, depth: int, keep: int)
+
+    What has been counted from some review text. The n-grams of all, voted up and voted
+    down reviews are counted in a CountMinSketch under the groups "all", "positive" and
+    "negative", with the keep most common of each remembered. The tokens in each month
+    and of each app are counted in a HeavyHitters with keep counters under
+    f"month:{slot}" and f"app:{appid}", as in one sketch with the others the counts of a
+    small app would be mostly collisions with everything else. Either way the memory
+    used doesn't grow with the amount of text. apps maps each appid to its (months, 5)
+    grid of review counts and sentiment.
+    '''
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, keep: int = 100):
+        self.sketch = CountMinSketch(width, depth)
+        self.keep = keep
+        self.candidates = {}
+        self.hitters = {}
+        self.apps = {}
+        self.reviews = 0
+
+    def app_grid(self, appid: int):
+        '''
+        Gets the grid for an app, adding an empty one the first time.
+
+        Returns:
+        (months, 5) np.ndarray of float64
+        '''
+        grid = self.apps.get(appid)
+        if grid is None:
+            grid = self.apps[appid] = np.zeros((len(MONTHS), 5))
+        return grid
+
+    def add(self, counts: Counter):
+        '''
+        Adds a chunk's counts of f"{group}\\t{gram}" keys.
+        '''
+        groups, sketch_keys = defaultdict(dict), []
+        for key, count in counts.items():
+            group, gram = key.split("\t", 1)
+            groups[group][gram] = count
+            if group in SKETCH_GROUPS:
+                sketch_keys.append(key)
+        self.sketch.add(sketch_keys, [counts[x] for x in sketch_keys])
+        for group, grams in groups.items():
+            if group not in SKETCH_GROUPS:
+                self.hitters.setdefault(group, HeavyHitters(self.keep)).add(grams)
+        self.refresh({group: set(grams) for group, grams in groups.items() if group in SKETCH_GROUPS})
+
+    def refresh(self, groups: dict):
+        '''
+        Estimates the counts of the grams in each sketch group along with the group's
+        current top grams, and keeps the top ones.
+        '''
+        keys = [(group, gram) for group, grams in groups.items()
+                for gram in grams | self.candidates.get(group, {}).keys()]
+        estimates = self.sketch.query([f"{group}\t{gram}" for group, gram in keys])
+        merged = defaultdict(dict)
+        for (group, gram), estimate in zip(keys, estimates.tolist()):
+            merged[group][gram] = estimate
+        for group, grams in merged.items():
+            self.candidates[group] = dict(heapq.nlargest(self.keep, grams.items(), key=lambda x: (x[1], x[0])))
+
+    def merge(self, other: "TextStats"):
+        '''
+        Adds the counts from another TextStats made with the same width, depth and keep.
+        '''
+        self.sketch.table += other.sketch.table
+        self.reviews += other.reviews
+        for appid, grid in other.apps.items():
+            self.app_grid(appid)[:] += grid
+        for group, hitters in other.hitters.items():
+            self.hitters.setdefault(group, HeavyHitters(self.keep)).add(hitters.counts, hitters.total)
+        groups = {group: set(grams) for group, grams in other.candidates.items()}
+        for group in self.candidates:
+            groups.setdefault(group, set())
+        self.refresh(groups)
+
+    def top(self, group: str, k: int = 20):
+        '''
+        Gets the most common grams in a group.
+
+        Returns:
+        list of (gram, estimated count), most common first
+        '''
+        if group in self.hitters:
+            return self.hitters[group].top(k)
+        grams = self.candidates.get(group, {}).items()
+        return sorted(grams, key=lambda x: (-x[1], x[0]))[:k]
+
+
+# Splits review text into lower case words, keeping apostrophes inside words.
+def tokenise(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+# Scores the sentiment of some tokens from -1 to 1, by adding up the lexicon scores of the
+# words, flipped if the word before is a negation, and squashing the sum the same way VADER
+# does. Returns 0 for text without any words in the lexicon.
+def sentiment(tokens: list, lexicon: dict = LEXICON):
+    total = 0
+    for i, token in enumerate(tokens):
+        score = lexicon.get(token)
+        if score:
+            total += -score if i and tokens[i-1] in NEGATIONS else score
+    return total / np.sqrt(total * total + 15) if total else 0.0
+
+# The 1 to n word n-grams of some words, as space separated strings.
+def ngrams(words: list, n: int):
+    for size in range(1, n + 1):
+        for i in range(len(words) - size + 1):
+            yield " ".join(words[i:i+size])
+
+# Reads a lexicon in the AFINN format, a word or phrase then a tab then its score on each line.
+def load_lexicon(path: str):
+    lexicon = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            word, _, score = line.rstrip("\n").rpartition("\t")
+            if word:
+                lexicon[word.lower()] = int(score)
+    return lexicon
+
+# Counts everything in one shard, a chunk of reviews at a time. Run in the worker processes,
+# which each send back a TextStats for the main process to merge.
+def analyse_shard(path: str, lexicon: dict = LEXICON, n: int = 2, width: int = SKETCH_WIDTH,
+                  depth: int = SKETCH_DEPTH, keep: int = 100, chunk_size: int = CHUNK_SIZE):
+    stats = TextStats(width, depth, keep)
+    reviews = read_shard(path)
+    while chunk := list(islice(reviews, chunk_size)):
+        counts = Counter()
+        slots = month_slots([x["timestamp_created"] for x in chunk]).tolist()
+        for review, slot in zip(chunk, slots):
+            tokens = tokenise(review["review"] or "")
+            score = sentiment(tokens, lexicon)
+            words = [x for x in tokens if x not in STOP_WORDS]
+            label = "positive" if review["voted_up"] else "negative"
+            for gram in ngrams(words, n):
+                counts[f"all\t{gram}"] += 1
+                counts[f"{label}\t{gram}"] += 1
+            for word in words:
+                counts[f"month:{slot}\t{word}"] += 1
+                counts[f"app:{review['appid']}\t{word}"] += 1
+            stats.app_grid(review["appid"])[slot] += (1, bool(review["voted_up"]), score > 0, score < 0, score)
+        stats.add(counts)
+        stats.reviews += len(chunk)
+    return stats
+
+# Analyses every shard in a folder, a shard per task on a process pool, merging the results
+# as they finish so only one shard's results are waiting at a time per worker.
+def analyse(folder: str = REVIEW_DIR, workers: int = os.cpu_count(), lexicon: dict = LEXICON, n: int = 2,
+            width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, keep: int = 100, metrics: Metrics = None):
+    stats = TextStats(width, depth, keep)
+    paths = find_shards(folder)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=worker_context()) as pool:
+        futures = [pool.submit(analyse_shard, path, lexicon, n, width, depth, keep) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            stats.merge(result)
+            if metrics:
+                metrics.rows()
+                metrics.report()
+    return stats
+
+# Saves the results to folder: text_appids.npy and text_grid.npy have each app's grid on
+# the same months as the time series, and top.json has the top grams of every group.
+def save(stats: TextStats, folder: str = TEXT_DIR):
+    os.makedirs(folder, exist_ok=True)
+    appids = np.array(sorted(stats.apps), dtype=np.int64)
+    grid = np.stack([stats.apps[x] for x in appids]) if len(appids) else np.zeros((0, len(MONTHS), 5))
+    np.save(os.path.join(folder, "text_appids.npy"), appids)
+    np.save(os.path.join(folder, "text_grid.npy"), grid)
+    top = {group: stats.top(group, stats.keep) for group in sorted(stats.candidates.keys() | stats.hitters.keys())}
+    write_text(os.path.join(folder, "top.json"), json.dumps(top))
+
+# Loads the results saved by save(). Returns the appids, the (apps, months, 5) grid and the
+# top grams of each group.
+def load(folder: str = TEXT_DIR):
+    appids = np.load(os.path.join(folder, "text_appids.npy"))
+    grid = np.load(os.path.join(folder, "text_grid.npy"), mmap_mode="r")
+    with open(os.path.join(folder, "top.json")) as f:
+        top = json.load(f)
+    return appids, grid, top
+
+# Makes a dataframe like import_data's from the saved results, with a time series for each app
+# which analysis.py's charts can use. With sentiment=True the up and down counts are the reviews
+# whose text scored positive and negative, otherwise they are the downloaded reviews voted up
+# and down. Merge it with import_data() on appid for the rest of the columns.
+def text_frame(folder: str = TEXT_DIR, sentiment: bool = True):
+    appids, grid, _ = load(folder)
+    up, down = (POSITIVE, NEGATIVE) if sentiment else (VOTED_UP, REVIEWS)
+    counts = np.stack([grid[:, :, up], grid[:, :, down]], axis=2).astype(np.int32)
+    if not sentiment:
+        counts[:, :, 1] -= counts[:, :, 0]
+    df = pd.DataFrame({"appid": appids})
+    df["time_series"] = [MonthSeries(MONTH_ARRAY, row) for row in counts]
+    df.attrs["source"] = file_fingerprint(os.path.join(folder, "text_grid.npy")) + str(sentiment)
+    return df
+
+# The mean sentiment score of the reviews made in each month across every app, nan for
+# months without any reviews.
+def month_sentiment(grid: np.ndarray):
+    totals = grid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals[:, SCORE] / totals[:, REVIEWS]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-i", "--in", action="store", dest="folder", default=REVIEW_DIR,
+                        help="Folder with the review shards from review-text.py")
+    parser.add_argument("-o", "--out", action="store", dest="out", default=TEXT_DIR,
+                        help="Folder to save the results in")
+    parser.add_argument("-w", "--workers", action="store", dest="workers", type=int, default=os.cpu_count(),
+                        help="Number of processes to read the shards with")
+    parser.add_argument("-n", "--ngrams", action="store", dest="n", type=int, default=2,
+                        help="Count n-grams of up to this many words")
+    parser.add_argument("-k", "--top", action="store", dest="top", type=int, default=100,
+                        help="Number of the most common tokens and n-grams to keep for each group")
+    parser.add_argument("--width", action="store", dest="width", type=int, default=SKETCH_WIDTH,
+                        help="Width of the count-min sketch for all, voted up and voted down reviews, bigger is more accurate but uses more memory")
+    parser.add_argument("--lexicon", action="store", dest="lexicon", default="",
+                        help="AFINN format lexicon file to score the sentiment with instead of the built in one")
+    parser.add_argument("--metrics", action="store", dest="metrics", default="",
+                        help="File to write metrics to every 10 seconds, as JSON lines or a Prometheus text file if it ends in .prom")
+    args = parser.parse_args()
+
+    lexicon = load_lexicon(args.lexicon) if args.lexicon else LEXICON
+    metrics = Metrics("text", args.metrics, total=len(find_shards(args.folder)))
+    stats = analyse(args.folder, args.workers, lexicon, args.n, args.width, SKETCH_DEPTH, args.top, metrics)
+    save(stats, args.out)
+    metrics.report(force=True)
+    print(f"Analysed {stats.reviews} reviews of {len(stats.apps)} apps, saved to {args.out}")
+    for group in ("positive", "negative"):
+        print(f"Top n-grams in {group} reviews: "
+              + ", ".join(f"{gram} ({count})" for gram, count in stats.top(group, 15)))
@@ -1,13 +1,51 @@
 import datetime as dt
+from bisect import bisect_right
+import multiprocessing as mp
+import numpy as np
 
-pre_zero = lambda x: f"0{x}" if x < 10 else f"{x}"
-string_dates = [f"{year}-{pre_zero(x)}-01T00:00:00Z" for year in range(2011,dt.date.today().year)
-                for x in range(1,13)] # Add the full years
-string_dates += [f"2010-{pre_zero(x)}-01T00:00:00Z" for x in range(10,13)] # Add end of 2010
-string_dates += [f"{dt.date.today().year}-{pre_zero(x)}-01T00:00:00Z" # Add the months of this year
-                 for x in range(1,dt.date.today().month)] # including the current one TODO (add +1 back in when sharing code)
+FIRST_MONTH = np.datetime64("2010-10", "M") # Earliest reviews are from October 2010
 
-MONTHS = sorted([int(dt.datetime.fromisoformat(date).timestamp()) for date in string_dates][:-1]) # (Remove the -1 when sharing)
+# Makes the timestamps of midnight UTC on the 1st of every month from FIRST_MONTH up to and
+# including the month of last, which defaults to the current one so the range grows by
+# itself as time passes.
+def month_range(last = None):
+    last = np.datetime64(last or dt.datetime.now(tz=dt.UTC).strftime("%Y-%m"), "M")
+    return np.arange(FIRST_MONTH, last + 1).astype("datetime64[s]").astype(np.int64)
+
+MONTH_ARRAY = month_range()
+MONTHS = MONTH_ARRAY.tolist()
+# The year and the month from 1 to 12 of each month in MONTHS, so they never need working out
+_month_counts = np.arange(len(MONTHS)) + FIRST_MONTH.astype(np.int64) + 1970 * 12
+MONTH_YEARS = (_month_counts // 12).tolist()
+MONTH_NUMBERS = (_month_counts % 12 + 1).tolist()
+
+# The multiprocessing context for the process pools. Forked workers start with everything
+# the parent has already imported and loaded, where spawned ones import numpy, pandas and
+# the script again before they can do anything. None uses the default where there's no fork.
+def worker_context():
+    return mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+
+# Finds the month a timestamp is in, as an index into MONTHS. Anything after the last month
+# goes into the last month, anything before the first month is an error.
+def month_slot(timestamp: int):
+    slot = bisect_right(MONTHS, timestamp) - 1
+    if slot < 0:
+        raise ValueError(f"{timestamp} is from before the first month in MONTHS")
+    return slot
+
+# The same as month_slot for an array of timestamps, done with month arithmetic rather
+# than searching.
+def month_slots(timestamps):
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    slots = timestamps.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) \
+        - FIRST_MONTH.astype(np.int64)
+    if len(slots) and slots.min() < 0:
+        raise ValueError("Review data from before the first month in MONTHS")
+    return np.minimum(slots, len(MONTHS) - 1)
+
+# Moves a timestamp to midnight UTC on the 1st of its month.
+def month_start(timestamp: int):
+    return MONTHS[month_slot(timestamp)]
 
 class MonthlyRecommends:
     '''
@@ -18,15 +56,13 @@ class MonthlyRecommends:
     of positive and the number of negative reviews
     '''
     def __init__(self, date: str, up: int, down: int):
-        if int(date) in MONTHS:
-            self.date = str(date)
-        else:
-            self.date = str(max(month for month in MONTHS if month < int(date)))
+        slot = month_slot(int(date))
+        self.date = str(MONTHS[slot])
         self.up = up
         self.down = down
         self.total = up + down
-        self.year = dt.datetime.fromtimestamp(int(self.date),tz=dt.UTC).year
-        self.month = dt.datetime.fromtimestamp(int(self.date),tz=dt.UTC).month
+        self.year = MONTH_YEARS[slot]
+        self.month = MONTH_NUMBERS[slot]
 
     def __eq__(self, other):
         if not isinstance(other, MonthlyRecommends):
@@ -85,3 +121,156 @@ class MonthlyRecommends:
         if self.total > 0:
             return (self.up / self.total) * 100
         return None
+
+
+class MonthSeries:
+    '''
+    MonthSeries(months: np.ndarray, counts: np.ndarray)
+
+    The review data for one game as a (months, 2) array of up and down counts, with
+    months being the shared array of month timestamps. The counts are usually a view
+    into the array for every game so nothing is copied. Indexing or iterating gives
+    MonthlyRecommends for code which works with those.
+    '''
+    __slots__ = ("months", "counts")
+
+    def __init__(self, months: np.ndarray, counts: np.ndarray):
+        self.months = months
+        self.counts = counts
+
+    @classmethod
+    def from_records(cls, records: list):
+        '''
+        Makes a MonthSeries from a sorted list of MonthlyRecommends.
+
+        Returns:
+        MonthSeries
+        '''
+        months = np.array([int(x.date) for x in records], dtype=np.int64)
+        counts = np.array([(x.up, x.down) for x in records], dtype=np.int32).reshape(-1, 2)
+        return cls(months, counts)
+
+    def __len__(self):
+        return len(self.months)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        return MonthlyRecommends(str(self.months[i]), int(self.counts[i, 0]), int(self.counts[i, 1]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    @property
+    def up(self):
+        '''
+        The number of positive reviews for each month.
+        '''
+        return self.counts[:, 0]
+
+    @property
+    def down(self):
+        '''
+        The number of negative reviews for each month.
+        '''
+        return self.counts[:, 1]
+
+    @property
+    def total(self):
+        '''
+        The number of reviews for each month.
+        '''
+        return self.counts[:, 0] + self.counts[:, 1]
+
+    def get_scores(self):
+        '''
+        Calculates the review score for every month, the same as MonthlyRecommends.get_score
+
+        Returns:
+        np.ndarray of floats, nan for months with no reviews
+        '''
+        total = self.total
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, (self.up / total) * 100, np.nan)
+
+
+class SeriesIndex:
+    '''
+    SeriesIndex(months: np.ndarray, load, keep: bool)
+
+    Where the time series of a set of games are stored, so each one is only decoded
+    when something uses it. load takes an array of the positions of games in the
+    stored data and returns their (games, months, 2) counts. If keep is True decoded
+    games are kept, for data which is slow to decode, otherwise they are loaded
+    again each time, for data which is memory mapped.
+    '''
+    def __init__(self, months: np.ndarray, load, keep: bool = True):
+        self.months = months
+        self.load = load
+        self.keep = keep
+        self.decoded = {}
+
+    def matrix(self, positions):
+        '''
+        Gets the counts of the games at the positions, only decoding the ones which
+        haven't been yet.
+
+        Returns:
+        (len(positions), months, 2) np.ndarray
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return np.zeros((0, len(self.months), 2), dtype=np.int32)
+        if not self.keep:
+            return np.asarray(self.load(positions))
+        missing = [x for x in dict.fromkeys(positions.tolist()) if x not in self.decoded]
+        if missing:
+            self.decoded.update(zip(missing, self.load(np.array(missing, dtype=np.int64))))
+        return np.stack([self.decoded[x] for x in positions.tolist()])
+
+
+class LazySeries:
+    '''
+    LazySeries(index: SeriesIndex, position: int)
+
+    Stands in for the MonthSeries of the game at position in a SeriesIndex, decoding
+    it the first time anything on it is used. analysis.series_matrix decodes all the
+    LazySeries in a df at once instead.
+    '''
+    __slots__ = ("index", "position", "_series")
+
+    def __init__(self, index: SeriesIndex, position: int):
+        self.index = index
+        self.position = position
+        self._series = None
+
+    def series(self):
+        '''
+        Decodes the series if it hasn't been yet.
+
+        Returns:
+        MonthSeries
+        '''
+        if self._series is None:
+            self._series = MonthSeries(self.index.months, self.index.matrix([self.position])[0])
+        return self._series
+
+    def __getattr__(self, name):
+        if name in LazySeries.__slots__: # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.series(), name)
+
+    def __len__(self):
+        return len(self.series())
+
+    def __getitem__(self, i):
+        return self.series()[i]
+
+    def __iter__(self):
+        return iter(self.series())
+
+    def __repr__(self) -> str:
+        return repr(self.series())
@@ -0,0 +1,67 @@
+import time
+import pandas as pd
+
+# Finds the rows which still have the marker value and so still need fetching.
+# This is done once at the start instead of rescanning the column for every app.
+def pending_rows(series: pd.Series, marker = "Unknown"):
+    return series.index[series == marker].tolist()
+
+
+class ColumnBatch:
+    '''
+    ColumnBatch(columns: list)
+
+    Collects the results for a batch of rows as lists of column values, so they can
+    be merged into the dataframe in one go instead of one row at a time.
+    '''
+    def __init__(self, columns: list):
+        self.columns = columns
+        self.index = []
+        self.data = {column: [] for column in columns}
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, idx, row: dict):
+        '''
+        Adds the results for the row at idx to the batch.
+        '''
+        self.index.append(idx)
+        for column in self.columns:
+            self.data[column].append(row[column])
+
+    def merge(self, df: pd.DataFrame):
+        '''
+        Writes every row in the batch into df and empties the batch.
+        '''
+        if not self.index:
+            return
+        batch_df = pd.DataFrame(self.data, index=self.index, columns=self.columns)
+        for column in self.columns:
+            if batch_df[column].dtype == object and df[column].dtype != object:
+                df[column] = df[column].astype(object) # So lists can go in a column of strings
+            df.loc[self.index, column] = batch_df[column]
+        self.index = []
+        self.data = {column: [] for column in self.columns}
+
+
+# Merges a dict of appid to record into the dataframe in one batch, matching the
+# records to rows by appid rather than by position.
+def merge_records(df: pd.DataFrame, records: dict, columns: list):
+    rows = dict(zip(df["appid"].astype(str), df.index))
+    batch = ColumnBatch(columns)
+    for appid, record in records.items():
+        if appid in rows:
+            batch.add(rows[appid], record)
+    batch.merge(df)
+
+
+# Finds the rows which were fetched before the app last changed on steam, or more than
+# max_age seconds ago. Rows which have never been fetched have a fetched time of 0.
+def stale_rows(df: pd.DataFrame, fetched_column: str, max_age = None):
+    stale = pd.Series(False, index=df.index)
+    if "last_modified" in df.columns:
+        stale |= df["last_modified"].fillna(0) > df[fetched_column]
+    if max_age is not None:
+        stale |= df[fetched_column] < time.time() - max_age
+    return df.index[stale].tolist()